@@ -20,8 +20,11 @@ class User(AbstractUser):
     def __str__(self) -> str:
         full_name = self.get_full_name()
         display_name = full_name or self.username
-        return f'{display_name} ({self.get_role_display()})'
+        return f'{display_name} ({_ROLE_LABELS.get(self.role, self.role)})'
 
     class Meta(AbstractUser.Meta):
         verbose_name = 'Utilisateur'
         verbose_name_plural = 'Utilisateurs'
+
+
+_ROLE_LABELS = dict(User.Roles.choices)
@@ -1,7 +1,14 @@
+from datetime import date
+
 from django.contrib import admin
-from import_export import resources
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils.translation import gettext_lazy as _
+from import_export import fields
 from import_export.admin import ImportExportModelAdmin
 
+from pharmacy_pos.common.admin import ChangeListDeferMixin, is_autocomplete_request
+from pharmacy_pos.common.resources import ExportFieldsModelResource
+
 from .models import (
     Category,
     DosageForm,
@@ -13,7 +20,7 @@ from .models import (
 )
 
 
-class CategoryResource(resources.ModelResource):
+class CategoryResource(ExportFieldsModelResource):
     class Meta:
         model = Category
         fields = ('id', 'name', 'code', 'description', 'created_at', 'updated_at')
@@ -33,7 +40,7 @@ class DosageFormAdmin(ImportExportModelAdmin):
     search_fields = ('name',)
 
 
-class SupplierResource(resources.ModelResource):
+class SupplierResource(ExportFieldsModelResource):
     class Meta:
         model = Supplier
         fields = ('id', 'name', 'email', 'phone', 'address', 'created_at', 'updated_at')
@@ -41,13 +48,43 @@ class SupplierResource(resources.ModelResource):
 
 
 @admin.register(Supplier)
-class SupplierAdmin(ImportExportModelAdmin):
+class SupplierAdmin(ChangeListDeferMixin, ImportExportModelAdmin):
     resource_class = SupplierResource
     list_display = ('name', 'email', 'phone')
     search_fields = ('name', 'email', 'phone')
+    changelist_defer = ('address',)
+
 
+class BelowThresholdFilter(admin.SimpleListFilter):
+    """
+    Filtre les produits dont le stock est sous le seuil d'alerte.
+    S'appuie sur l'annotation _is_below_threshold de ProductAdmin.get_queryset.
+    """
+    title = _('Sous le seuil')
+    parameter_name = 'below_threshold'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', _('Oui')),
+            ('no', _('Non')),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(_is_below_threshold=True)
+        elif self.value() == 'no':
+            return queryset.filter(_is_below_threshold=False)
+        return queryset
+
+
+class ProductResource(ExportFieldsModelResource):
+    # Colonnes dénormalisées : exportées telles quelles, jamais importées
+    stock_quantity = fields.Field(attribute='stock_quantity', column_name='stock_quantity', readonly=True)
+    last_purchase_price = fields.Field(
+        attribute='last_purchase_price', column_name='last_purchase_price', readonly=True,
+    )
+    last_sale_price = fields.Field(attribute='last_sale_price', column_name='last_sale_price', readonly=True)
 
-class ProductResource(resources.ModelResource):
     class Meta:
         model = Product
         fields = (
@@ -57,6 +94,9 @@ class ProductResource(resources.ModelResource):
             'category__name',
             'dosage_form__name',
             'stock_threshold',
+            'stock_quantity',
+            'last_purchase_price',
+            'last_sale_price',
             'supplier__name',
             'created_at',
             'updated_at',
@@ -65,7 +105,7 @@ class ProductResource(resources.ModelResource):
 
 
 @admin.register(Product)
-class ProductAdmin(ImportExportModelAdmin):
+class ProductAdmin(ChangeListDeferMixin, ImportExportModelAdmin):
     resource_class = ProductResource
     list_display = (
         'name',
@@ -78,7 +118,9 @@ class ProductAdmin(ImportExportModelAdmin):
         'stock_threshold',
         'is_below_threshold',
     )
-    list_filter = ('category', 'dosage_form', 'supplier')
+    list_filter = ('category', 'dosage_form', 'supplier', BelowThresholdFilter)
+    list_select_related = ('category', 'dosage_form', 'supplier')
+    changelist_defer = ('notes', 'image', 'supplier__address')
     search_fields = ('name', 'barcode')
     readonly_fields = ('purchase_price', 'sale_price', 'total_stock', 'total_expired_stock', 'created_at', 'updated_at')
     fieldsets = (
@@ -87,18 +129,64 @@ class ProductAdmin(ImportExportModelAdmin):
         ('Informations complémentaires', {'fields': ('notes', 'created_at', 'updated_at')}),
     )
 
+    def get_queryset(self, request):
+        """
+        Calcule les stocks de tous les produits en une seule requête agrégée
+        au lieu d'une requête SUM par ligne.
+        Les jointures de la liste passent par list_select_related.
+        L'autocomplétion (lignes de vente, lots) n'affiche que __str__ :
+        ni jointures ni agrégats.
+        """
+        queryset = super().get_queryset(request)
+        if is_autocomplete_request(request):
+            return queryset
+        return Product.with_stock(queryset)
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if is_autocomplete_request(request):
+            # Seules les colonnes lues par __str__ : pas de notes ni d'image
+            queryset = queryset.only('id', 'name', 'barcode')
+        return queryset, may_have_duplicates
+
+    @admin.display(description='Stock total', ordering='_total_stock')
+    def total_stock(self, obj):
+        return obj.total_stock
+
+    @admin.display(description='Stock expiré', ordering='_total_expired_stock')
+    def total_expired_stock(self, obj):
+        return obj.total_expired_stock
+
+    @admin.display(boolean=True, description='Sous le seuil', ordering='_is_below_threshold')
+    def is_below_threshold(self, obj):
+        return obj.is_below_threshold
+
 
 @admin.register(PurchaseOrder)
-class PurchaseOrderAdmin(ImportExportModelAdmin):
+class PurchaseOrderAdmin(ChangeListDeferMixin, ImportExportModelAdmin):
     list_display = ('id', 'supplier', 'order_date', 'receipt_date', 'status')
     list_filter = ('status', 'order_date', 'supplier')
+    list_select_related = ('supplier',)
+    changelist_defer = ('notes', 'supplier__address')
     search_fields = ('supplier__name', 'notes')
     readonly_fields = ('created_at', 'updated_at')
     date_hierarchy = 'order_date'
 
 
+class LotResource(ExportFieldsModelResource):
+    class Meta:
+        model = Lot
+        exclude = ('product_name',)
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        if instance._state.adding:
+            Lot.objects.start_full(instance)
+
+
 @admin.register(Lot)
 class LotAdmin(ImportExportModelAdmin):
+    resource_class = LotResource
     list_display = (
         'product',
         'purchase_order',
@@ -110,7 +198,8 @@ class LotAdmin(ImportExportModelAdmin):
         'is_expired',
     )
     list_filter = ('is_active', 'expiration_date', 'purchase_order__supplier')
-    search_fields = ('product__name', 'product__barcode', 'batch_number')
+    list_select_related = ('product', 'purchase_order')
+    search_fields = ('product_name', 'batch_number', 'product__barcode')
     readonly_fields = ('is_expired', 'is_exhausted', 'created_at', 'updated_at')
     date_hierarchy = 'expiration_date'
     fieldsets = (
@@ -120,10 +209,40 @@ class LotAdmin(ImportExportModelAdmin):
         ('Statut', {'fields': ('is_active', 'is_expired', 'is_exhausted', 'created_at', 'updated_at')}),
     )
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            Lot.objects.start_full(obj)
+        super().save_model(request, obj, form, change)
+
+    def get_queryset(self, request):
+        """
+        Le statut « expiré » est calculé par la base, avec une seule date du jour
+        pour toute la page. Les jointures de la liste passent par
+        list_select_related : l'autocomplétion des lots reste sur la seule
+        table des lots (__str__ lit product_name).
+        """
+        return super().get_queryset(request).annotate(
+            _is_expired=ExpressionWrapper(
+                Q(expiration_date__lte=date.today()),
+                output_field=BooleanField(),
+            ),
+        )
+
+    @admin.display(boolean=True, description='Expiré', ordering='_is_expired')
+    def is_expired(self, obj):
+        return obj.is_expired
+
 
 @admin.register(StockMovement)
-class StockMovementAdmin(ImportExportModelAdmin):
-    list_display = ('lot', 'movement_type', 'quantity', 'movement_date', 'source')
+class StockMovementAdmin(ChangeListDeferMixin, ImportExportModelAdmin):
+    list_display = ('product', 'lot', 'movement_type', 'quantity', 'movement_date', 'source')
     list_filter = ('movement_type', 'movement_date')
-    search_fields = ('lot__product__name', 'source')
+    list_select_related = ('lot',)
+    changelist_defer = ('comment',)
+    search_fields = ('lot__product_name', 'source')
+    autocomplete_fields = ('lot',)
     readonly_fields = ('created_at', 'updated_at')
+
+    @admin.display(description='Produit', ordering='lot__product_name')
+    def product(self, obj):
+        return obj.lot.product_name
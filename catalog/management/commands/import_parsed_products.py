@@ -4,10 +4,10 @@ import json
 from datetime import date
 from decimal import Decimal
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
 
 from django.core.management.base import BaseCommand, CommandError, CommandParser
-from django.db import transaction
+from django.db import models, transaction
 from django.utils import timezone
 
 from catalog.models import (
@@ -52,9 +52,26 @@ class Command(BaseCommand):
         errors: List[str] = []
         created = 0
         updated = 0
+        self._pending_lots: List[Lot] = []
+        self._pending_movements: List[StockMovement] = []
 
         context_manager = transaction.atomic() if not dry_run else _nullcontext()
         with context_manager:
+            # Résolution nom -> id en quelques requêtes pour tout le fichier,
+            # au lieu d'un get_or_create par produit.
+            valid_items = [item for item in products if not item.get('errors')]
+            self._category_ids = self._resolve_ids(
+                Category,
+                (item.get('category_name') for item in valid_items),
+                defaults=lambda name: {'code': name[:50]},
+            )
+            self._dosage_form_ids = self._resolve_ids(
+                DosageForm, (item.get('dosage_form_name') for item in valid_items)
+            )
+            self._supplier_ids = self._resolve_ids(
+                Supplier, (item.get('supplier_name') for item in valid_items)
+            )
+
             for item in products:
                 if item.get('errors'):
                     errors.append(
@@ -74,6 +91,11 @@ class Command(BaseCommand):
                         f"Failed to import product {item.get('source_id')} ({item.get('name')}): {exc}"
                     )
 
+            # Lots insérés en une fois ; le stock initial est porté par
+            # Lot.remaining_quantity, les mouvements ne sont donc pas réappliqués.
+            Lot.objects.bulk_create_lots(self._pending_lots)
+            StockMovement.objects.bulk_create(self._pending_movements, batch_size=1000)
+
         for error in errors:
             self.stderr.write(self.style.WARNING(error))
 
@@ -93,27 +115,24 @@ class Command(BaseCommand):
         if not dosage_form_name:
             raise ValueError('Missing dosage_form_name')
 
-        category, _ = Category.objects.get_or_create(
-            name=category_name,
-            defaults={'code': category_name[:50]},
-        )
-        dosage_form, _ = DosageForm.objects.get_or_create(name=dosage_form_name)
+        category_id = self._category_ids.get(category_name)
+        if category_id is None:
+            raise ValueError(f'Unable to create category "{category_name}"')
+        dosage_form_id = self._dosage_form_ids[dosage_form_name]
 
         barcode = item.get('barcode')
         if not barcode:
             raise ValueError('Missing barcode')
 
         supplier_name = item.get('supplier_name')
-        supplier = None
-        if supplier_name:
-            supplier, _ = Supplier.objects.get_or_create(name=supplier_name)
+        supplier_id = self._supplier_ids[supplier_name] if supplier_name else None
 
         # Créer ou mettre à jour le produit (sans stock_quantity, expiration_date, purchase_price, sale_price)
         product_defaults = {
             'name': item.get('name', ''),
-            'category': category,
-            'dosage_form': dosage_form,
-            'supplier': supplier,
+            'category_id': category_id,
+            'dosage_form_id': dosage_form_id,
+            'supplier_id': supplier_id,
             'stock_threshold': item.get('stock_alert') or 0,
             'notes': item.get('note') or '',
         }
@@ -132,15 +151,16 @@ class Command(BaseCommand):
         if quantity > 0 and expiration_date_str and not dry_run:
             # Créer une commande d'achat par défaut pour l'import
             # Utiliser le supplier du produit ou créer un supplier par défaut
-            import_supplier = supplier
-            if not import_supplier:
+            import_supplier_id = supplier_id
+            if not import_supplier_id:
                 import_supplier, _ = Supplier.objects.get_or_create(
                     name='Import automatique',
                     defaults={'notes': 'Fournisseur créé automatiquement lors de l\'import'}
                 )
-            
+                import_supplier_id = import_supplier.pk
+
             purchase_order, _ = PurchaseOrder.objects.get_or_create(
-                supplier=import_supplier,
+                supplier_id=import_supplier_id,
                 status=PurchaseOrder.Status.RECEIVED,
                 defaults={
                     'order_date': timezone.now(),
@@ -156,29 +176,50 @@ class Command(BaseCommand):
                 expiration_date = None
 
             if expiration_date:
-                # Créer le lot
-                lot = Lot.objects.create(
+                # Créer le lot et son mouvement de stock (insérés en lot à la fin de l'import)
+                lot = Lot(
                     purchase_order=purchase_order,
                     product=product,
                     quantity=quantity,
-                    remaining_quantity=quantity,
                     expiration_date=expiration_date,
                     purchase_price=purchase_price,
                     sale_price=sale_price,
                     batch_number=f'IMPORT-{barcode}',
                 )
-
-                # Créer le mouvement de stock
-                StockMovement.objects.create(
-                    lot=lot,
-                    movement_type=StockMovement.MovementType.IN,
-                    quantity=quantity,
-                    source='Initial import',
-                    comment='Initial stock from parsed feed',
+                self._pending_lots.append(lot)
+                self._pending_movements.append(
+                    StockMovement(
+                        lot=lot,
+                        movement_type=StockMovement.MovementType.IN,
+                        quantity=quantity,
+                        source='Initial import',
+                        comment='Initial stock from parsed feed',
+                    )
                 )
 
         return 'created' if product_created else 'updated'
 
+    @staticmethod
+    def _resolve_ids(
+        model: Type[models.Model],
+        names: Iterable[Optional[str]],
+        defaults: Optional[Callable[[str], Dict[str, Any]]] = None,
+    ) -> Dict[str, int]:
+        """
+        Retourne {nom: id} pour les noms donnés, en créant d'un seul bulk_create
+        ceux qui n'existent pas encore.
+        """
+        names = {name for name in names if name}
+        ids = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - ids.keys()
+        if missing:
+            model.objects.bulk_create(
+                [model(name=name, **(defaults(name) if defaults else {})) for name in missing],
+                ignore_conflicts=True,
+            )
+            ids.update(model.objects.filter(name__in=missing).values_list('name', 'id'))
+        return ids
+
     @staticmethod
     def _decimal_or_default(value: Optional[str]) -> Decimal:
         if value is None or value == '':
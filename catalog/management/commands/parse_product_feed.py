@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import codecs
 import json
+import os
 import re
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import count, islice
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, BinaryIO, Callable, DefaultDict, Deque, Dict, Iterable, Iterator, List, Optional
 
+import ijson
+from ijson.common import ObjectBuilder
 from django.core.management.base import BaseCommand, CommandError, CommandParser
 
 PREDEFINED_SUPPLIERS = [
@@ -19,8 +29,33 @@ PREDEFINED_SUPPLIERS = [
     {'code': 'SUP_007', 'name': 'Africa Health Care Pharma'},
 ]
 
+_CURRENCY_RE = re.compile(r'[^\d,.-]')
+_INT_RE = re.compile(r'[^\d-]')
+_STRIP_SEP = str.maketrans('', '', ',.')
+# Sortie compacte : pas d'indentation ni d'espaces superflus
+_JSON_SEPARATORS = (',', ':')
+_OUTPUT_BUFFER_SIZE = 1 << 20
+# Valeur par défaut partagée pour les sous-objets absents (jamais modifiée)
+_EMPTY_DICT: Dict[str, Any] = {}
 
-@dataclass
+
+@lru_cache(maxsize=4096)
+def _normalize_category_name(name: Optional[str]) -> str:
+    """
+    Normalise un nom de catégorie ; les valeurs identiques partagent la même chaîne.
+    """
+    return (name or '').strip() or 'Catégorie inconnue'
+
+
+@lru_cache(maxsize=4096)
+def _normalize_dosage_form_name(name: Optional[str]) -> str:
+    """
+    Normalise un nom de forme galénique ; les valeurs identiques partagent la même chaîne.
+    """
+    return (name or '').strip() or 'Forme inconnue'
+
+
+@dataclass(slots=True)
 class ParsedProduct:
     source_id: Optional[int]
     name: str
@@ -54,6 +89,179 @@ class ParsedProduct:
         }
 
 
+def _skip_bom(stream: BinaryIO) -> None:
+    """
+    Ignore le BOM UTF-8 éventuel en tête de fichier.
+    """
+    if stream.read(3) != codecs.BOM_UTF8:
+        stream.seek(0)
+
+
+def _iter_feed_records(stream: BinaryIO, metadata: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt payload['data'] élément par élément sans charger tout le fichier,
+    et renseigne metadata avec les valeurs scalaires de premier niveau
+    (recordsTotal, recordsFiltered, ...).
+    """
+    # use_float : nombres non entiers en float comme avec json.load (les
+    # Decimal ne passent pas dans JSONEncoder)
+    events = ijson.parse(stream, use_float=True)
+    for prefix, event, value in events:
+        if prefix == 'data.item' and event == 'start_map':
+            builder = ObjectBuilder()
+            builder.event(event, value)
+            for prefix, event, value in events:
+                if prefix == 'data.item' and event == 'end_map':
+                    break
+                builder.event(event, value)
+            yield builder.value
+        elif '.' not in prefix and event in ('number', 'string', 'boolean', 'null'):
+            metadata[prefix] = value
+
+
+def _normalize_barcode(value: Optional[str]) -> Optional[str]:
+    if value and isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+
+def _none(value: Any, errors: List[str], field: str) -> None:
+    return None
+
+
+def _currency_from_str(value: str, errors: List[str], field: str) -> Optional[Decimal]:
+    if value == '':
+        return None
+    cleaned = _CURRENCY_RE.sub('', value).translate(_STRIP_SEP)
+    if cleaned == '':
+        errors.append(f'Unable to parse {field}: original value "{value}"')
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        errors.append(f'Unable to parse {field} as decimal: "{value}"')
+        return None
+
+
+def _int_from_str(value: str, errors: List[str], field: str) -> Optional[int]:
+    if value == '':
+        return None
+    cleaned = _INT_RE.sub('', value)
+    if cleaned == '':
+        errors.append(f'Unable to parse {field}: original value "{value}"')
+        return None
+    try:
+        return int(cleaned)
+    except ValueError:
+        errors.append(f'Unable to parse {field} as integer: "{value}"')
+        return None
+
+
+# Aiguillage sur le type exact : ijson ne produit que ces types
+_CURRENCY_PARSERS: Dict[type, Callable[[Any, List[str], str], Optional[Decimal]]] = {
+    type(None): _none,
+    str: _currency_from_str,
+    int: lambda value, errors, field: Decimal(value),
+    float: lambda value, errors, field: Decimal(str(value)),
+    Decimal: lambda value, errors, field: value,
+}
+_INT_PARSERS: Dict[type, Callable[[Any, List[str], str], Optional[int]]] = {
+    type(None): _none,
+    str: _int_from_str,
+    int: lambda value, errors, field: value,
+    float: lambda value, errors, field: int(value),
+    Decimal: lambda value, errors, field: int(value),
+}
+
+
+def _unexpected_type(value: Any, errors: List[str], field: str) -> None:
+    errors.append(f'Unexpected type for {field}: {type(value).__name__}')
+    return None
+
+
+def _parse_currency(value: Any, errors: List[str], *, field: str) -> Optional[Decimal]:
+    return _CURRENCY_PARSERS.get(type(value), _unexpected_type)(value, errors, field)
+
+
+def _parse_int(value: Any, errors: List[str], *, field: str) -> Optional[int]:
+    return _INT_PARSERS.get(type(value), _unexpected_type)(value, errors, field)
+
+
+def _parse_single_product(raw: Dict[str, Any]) -> ParsedProduct:
+    """
+    Normalise un enregistrement brut.
+    Sans product_code exploitable, le code-barres reste vide : l'identifiant de
+    remplacement est attribué ensuite, dans l'ordre du flux, par le processus principal.
+    """
+    errors: List[str] = []
+    barcode = _normalize_barcode(raw.get('product_code'))
+    if barcode is None:
+        barcode = ''
+        errors.append('Missing or invalid product_code; generated fallback identifier.')
+
+    category_name = _normalize_category_name(raw.get('product_barcode_symbology'))
+    dosage_form_name = _normalize_dosage_form_name((raw.get('category') or _EMPTY_DICT).get('category_name'))
+    note = raw.get('product_note')
+
+    cost = _parse_currency(raw.get('product_cost'), errors, field='product_cost')
+    price = _parse_currency(raw.get('product_price'), errors, field='product_price')
+    quantity = _parse_int(raw.get('product_quantity'), errors, field='product_quantity')
+    stock_alert = _parse_int(raw.get('product_stock_alert'), errors, field='product_stock_alert')
+
+    expiration_date = raw.get('product_date_peremption')
+
+    return ParsedProduct(
+        source_id=raw.get('id'),
+        name=raw.get('product_name') or '',
+        barcode=barcode,
+        category_name=category_name,
+        dosage_form_name=dosage_form_name,
+        quantity=quantity,
+        cost=cost,
+        price=price,
+        stock_alert=stock_alert,
+        expiration_date=expiration_date,
+        note=note,
+        errors=errors,
+    )
+
+
+def _parse_chunk(raws: List[Dict[str, Any]]) -> List[ParsedProduct]:
+    """
+    Normalise un lot d'enregistrements (point d'entrée des processus de travail).
+    """
+    return [_parse_single_product(raw) for raw in raws]
+
+
+def _chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _iter_parsed_products(
+    records: Iterable[Dict[str, Any]], workers: int, chunk_size: int
+) -> Iterator[ParsedProduct]:
+    """
+    Normalise les enregistrements dans l'ordre du flux.
+    Avec plusieurs workers, les lots sont répartis sur un pool de processus ;
+    le nombre de lots en cours est borné pour ne pas lire tout le fichier d'avance.
+    """
+    if workers <= 1:
+        for chunk in _chunked(records, chunk_size):
+            yield from _parse_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        for chunk in _chunked(records, chunk_size):
+            pending.append(executor.submit(_parse_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
 class Command(BaseCommand):
     help = "Parse a product feed JSON file and extract normalized data without importing it."
 
@@ -64,6 +272,18 @@ class Command(BaseCommand):
             type=str,
             help='Optional path to write the parsed output JSON. Prints to stdout if omitted.',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes used to parse records (default: 1, no pool).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of records sent to a worker at once (default: 5000).',
+        )
 
     def handle(self, *args, **options) -> None:
         input_path = Path(options['input_file'])
@@ -71,156 +291,128 @@ class Command(BaseCommand):
 
         if not input_path.exists():
             raise CommandError(f"Input file {input_path} does not exist.")
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive integers.')
 
-        with input_path.open('r', encoding='utf-8-sig') as stream:
-            try:
-                payload = json.load(stream)
-            except json.JSONDecodeError as exc:
-                raise CommandError(f'Failed to parse JSON file: {exc}') from exc
-
-        products_raw = payload.get('data', [])
-        barcode_error_counter = 1
-        categories: Dict[str, Dict[str, str]] = {}
-        dosage_forms: Dict[str, Dict[str, str]] = {}
-        parsed_products: List[ParsedProduct] = []
+        fallback_ids = count(1)
+        processed = 0
+        # Index par nom normalisé (casefold) : nom affiché + identifiants sources
+        category_names: Dict[str, str] = {}
+        category_sources: DefaultDict[str, List[Optional[int]]] = defaultdict(list)
+        dosage_form_names: Dict[str, str] = {}
+        dosage_form_sources: DefaultDict[str, List[Optional[int]]] = defaultdict(list)
         errors: List[Dict[str, Any]] = []
+        metadata: Dict[str, Any] = {}
 
-        for index, raw in enumerate(products_raw, start=1):
-            product = self._parse_single_product(raw, barcode_error_counter)
-            if product.barcode.startswith('BARCODEERROR'):
-                barcode_error_counter += 1
-
-            categories.setdefault(
-                product.category_name.lower(),
-                {'name': product.category_name, 'source_ids': []},
-            )['source_ids'].append(product.source_id)
-
-            dosage_forms.setdefault(
-                product.dosage_form_name.lower(),
-                {'name': product.dosage_form_name, 'source_ids': []},
-            )['source_ids'].append(product.source_id)
-
-            parsed_products.append(product)
-
-            for error in product.errors:
-                errors.append(
-                    {
-                        'source_id': product.source_id,
-                        'index': index,
-                        'issue': error,
-                    }
+        # Lecture et écriture en flux : seuls le produit courant et les index
+        # catégories / formes galéniques restent en mémoire.
+        # Sortie indentée uniquement pour une lecture dans un terminal
+        pretty = output_path is None and self.stdout.isatty()
+        encode = json.JSONEncoder(
+            ensure_ascii=False,
+            indent=2 if pretty else None,
+            separators=None if pretty else _JSON_SEPARATORS,
+        ).encode
+
+        with input_path.open('rb') as stream, self._open_output(output_path) as write:
+            _skip_bom(stream)
+            write('{\n"suppliers": ')
+            write(encode(PREDEFINED_SUPPLIERS))
+            write(',\n"products": [\n')
+
+            try:
+                products = _iter_parsed_products(
+                    _iter_feed_records(stream, metadata),
+                    workers=options['workers'],
+                    chunk_size=options['chunk_size'],
                 )
+                for index, product in enumerate(products, start=1):
+                    if not product.barcode:
+                        product.barcode = f'BARCODEERROR{next(fallback_ids)}'
 
-        output_payload = {
-            'metadata': {
-                'total_records': payload.get('recordsTotal'),
-                'filtered_records': payload.get('recordsFiltered'),
-            },
-            'suppliers': PREDEFINED_SUPPLIERS,
-            'categories': [
-                {'name': item['name'], 'sources': item['source_ids']}
-                for item in categories.values()
-            ],
-            'dosage_forms': [
-                {'name': item['name'], 'sources': item['source_ids']}
-                for item in dosage_forms.values()
-            ],
-            'products': [product.to_dict() for product in parsed_products],
-            'errors': errors,
-        }
+                    key = product.category_name.casefold()
+                    category_names.setdefault(key, product.category_name)
+                    category_sources[key].append(product.source_id)
+
+                    key = product.dosage_form_name.casefold()
+                    dosage_form_names.setdefault(key, product.dosage_form_name)
+                    dosage_form_sources[key].append(product.source_id)
+
+                    if index > 1:
+                        write(',\n')
+                    write(encode(product.to_dict()))
+                    processed = index
+
+                    for error in product.errors:
+                        errors.append(
+                            {
+                                'source_id': product.source_id,
+                                'index': index,
+                                'issue': error,
+                            }
+                        )
+            except (ijson.JSONError, json.JSONDecodeError) as exc:
+                raise CommandError(f'Failed to parse JSON file: {exc}') from exc
 
-        serialized = json.dumps(output_payload, indent=2, ensure_ascii=False)
+            trailer = {
+                'categories': [
+                    {'name': name, 'sources': category_sources[key]}
+                    for key, name in category_names.items()
+                ],
+                'dosage_forms': [
+                    {'name': name, 'sources': dosage_form_sources[key]}
+                    for key, name in dosage_form_names.items()
+                ],
+                'errors': errors,
+                'metadata': {
+                    'total_records': metadata.get('recordsTotal'),
+                    'filtered_records': metadata.get('recordsFiltered'),
+                },
+            }
+            write('\n]')
+            for key, value in trailer.items():
+                write(f',\n"{key}": ')
+                write(encode(value))
+            write('\n}\n')
 
         if output_path:
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            output_path.write_text(serialized, encoding='utf-8')
             self.stdout.write(self.style.SUCCESS(f'Parsed data written to {output_path}'))
-        else:
-            self.stdout.write(serialized)
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Processed {len(parsed_products)} products. '
-                f'{len(categories)} category candidates, {len(dosage_forms)} dosage forms.'
+                f'Processed {processed} products. '
+                f'{len(category_names)} category candidates, {len(dosage_form_names)} dosage forms.'
             )
         )
 
-    def _parse_single_product(self, raw: Dict[str, Any], barcode_error_counter: int) -> ParsedProduct:
-        errors: List[str] = []
-        barcode = self._normalize_barcode(raw.get('product_code'), barcode_error_counter)
-        if barcode.startswith('BARCODEERROR'):
-            errors.append('Missing or invalid product_code; generated fallback identifier.')
-
-        category_name = raw.get('product_barcode_symbology') or 'Catégorie inconnue'
-        dosage_form_name = raw.get('category', {}).get('category_name') or 'Forme inconnue'
-        note = raw.get('product_note')
-
-        cost = self._parse_currency(raw.get('product_cost'), errors, field='product_cost')
-        price = self._parse_currency(raw.get('product_price'), errors, field='product_price')
-        quantity = self._parse_int(raw.get('product_quantity'), errors, field='product_quantity')
-        stock_alert = self._parse_int(raw.get('product_stock_alert'), errors, field='product_stock_alert')
-
-        expiration_date = raw.get('product_date_peremption')
-
-        return ParsedProduct(
-            source_id=raw.get('id'),
-            name=raw.get('product_name') or '',
-            barcode=barcode,
-            category_name=category_name,
-            dosage_form_name=dosage_form_name,
-            quantity=quantity,
-            cost=cost,
-            price=price,
-            stock_alert=stock_alert,
-            expiration_date=expiration_date,
-            note=note,
-            errors=errors,
-        )
-
-    @staticmethod
-    def _normalize_barcode(value: Optional[str], fallback_counter: int) -> str:
-        if value and isinstance(value, str) and value.strip():
-            return value.strip()
-        return f'BARCODEERROR{fallback_counter}'
-
-    @staticmethod
-    def _parse_currency(value: Optional[str], errors: List[str], *, field: str) -> Optional[Decimal]:
-        if value in (None, ''):
-            return None
-        if isinstance(value, (int, float, Decimal)):
-            return Decimal(str(value))
-        if isinstance(value, str):
-            cleaned = re.sub(r'[^\d,.-]', '', value)
-            cleaned = cleaned.replace(',', '').replace('.', '')
-            if cleaned == '':
-                errors.append(f'Unable to parse {field}: original value "{value}"')
-                return None
-            try:
-                return Decimal(cleaned)
-            except InvalidOperation:
-                errors.append(f'Unable to parse {field} as decimal: "{value}"')
-                return None
-        errors.append(f'Unexpected type for {field}: {type(value).__name__}')
-        return None
-
-    @staticmethod
-    def _parse_int(value: Any, errors: List[str], *, field: str) -> Optional[int]:
-        if value in (None, ''):
-            return None
-        if isinstance(value, int):
-            return value
-        if isinstance(value, float):
-            return int(value)
-        if isinstance(value, str):
-            cleaned = re.sub(r'[^\d-]', '', value)
-            if cleaned == '':
-                errors.append(f'Unable to parse {field}: original value "{value}"')
-                return None
+    @contextmanager
+    def _open_output(self, output_path: Optional[Path]) -> Iterator[Callable[[str], Any]]:
+        """
+        Fournit une fonction d'écriture vers le fichier de sortie ou vers stdout.
+        """
+        if output_path is None:
+            # Écriture directe dans le tampon binaire de la sortie standard
+            # (OutputWrapper délègue l'attribut buffer au flux sous-jacent).
+            buffer = getattr(self.stdout, 'buffer', None)
+            if buffer is None:
+                yield lambda chunk: self.stdout.write(chunk, ending='')
+                return
+            self.stdout.flush()
             try:
-                return int(cleaned)
-            except ValueError:
-                errors.append(f'Unable to parse {field} as integer: "{value}"')
-                return None
-        errors.append(f'Unexpected type for {field}: {type(value).__name__}')
-        return None
-
+                yield lambda chunk: buffer.write(chunk.encode('utf-8'))
+            finally:
+                buffer.flush()
+            return
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Fichier temporaire renommé seulement en cas de succès : une erreur
+        # ne laisse jamais de sortie tronquée
+        fd, tmp_name = tempfile.mkstemp(
+            dir=output_path.parent, prefix=f'.{output_path.name}.', suffix='.tmp',
+        )
+        try:
+            with open(fd, 'w', encoding='utf-8', buffering=_OUTPUT_BUFFER_SIZE) as fp:
+                yield fp.write
+            os.replace(tmp_name, output_path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the denormalized stock and price columns of products from their lots. '
+        'Run daily so that lots expiring overnight move to the expired stock.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            'product_ids',
+            nargs='*',
+            type=int,
+            help='Optional product ids to refresh. All products are refreshed if omitted.',
+        )
+
+    def handle(self, *args, **options) -> None:
+        product_ids = options['product_ids'] or None
+        updated = Product.refresh_stock_fields(product_ids)
+        self.stdout.write(self.style.SUCCESS(f'Stock refreshed for {updated} products.'))
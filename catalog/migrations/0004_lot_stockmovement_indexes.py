@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-15 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_purchaseorder_remove_product_expiration_date_and_more'),
+    ]
+
+    operations = [
+        # (product, is_active, expiration_date) : égalités d'abord, puis la plage sur la date
+        migrations.RemoveIndex(
+            model_name='lot',
+            name='catalog_lot_product_683691_idx',
+        ),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['product', 'is_active', 'expiration_date'], name='lot_prod_active_exp'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['-movement_date', 'movement_type'], name='stockmvt_date_type_idx'),
+        ),
+    ]
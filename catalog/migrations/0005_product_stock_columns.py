@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-15 10:00
+
+from datetime import date
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_product_stock_columns(apps, schema_editor):
+    """
+    Calcule les colonnes dénormalisées à partir des lots existants.
+    """
+    Product = apps.get_model('catalog', 'Product')
+    Lot = apps.get_model('catalog', 'Lot')
+
+    today = date.today()
+    active_lots = Lot.objects.filter(product=OuterRef('pk'), is_active=True).order_by()
+
+    def lot_sum(lots):
+        return Coalesce(
+            Subquery(
+                lots.values('product').annotate(total=Sum('remaining_quantity')).values('total'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    def last_price(field):
+        return Coalesce(
+            Subquery(active_lots.order_by('-created_at').values(field)[:1]),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    Product.objects.update(
+        stock_quantity=lot_sum(active_lots.filter(expiration_date__gt=today)),
+        expired_stock_quantity=lot_sum(active_lots.filter(expiration_date__lte=today)),
+        last_purchase_price=last_price('purchase_price'),
+        last_sale_price=last_price('sale_price'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_lot_stockmovement_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_quantity',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Stock disponible'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='expired_stock_quantity',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Stock expiré'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_purchase_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name="Dernier prix d'achat"),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_sale_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Dernier prix de vente'),
+        ),
+        migrations.RunPython(fill_product_stock_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_product_stock_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['product', 'is_active', '-created_at'], name='lot_prod_active_created_idx'),
+        ),
+    ]
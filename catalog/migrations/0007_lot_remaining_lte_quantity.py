@@ -0,0 +1,74 @@
+# Generated by Django 5.2.8 on 2026-10-15 11:00
+
+from datetime import date
+
+from django.db import migrations, models
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def clamp_remaining_quantity(apps, schema_editor):
+    """
+    Les anciens ajustements pouvaient dépasser la quantité initiale :
+    on les ramène à cette quantité pour que la contrainte puisse être posée.
+    Chaque lot corrigé reçoit un mouvement d'ajustement (trace de la
+    correction) et le stock dénormalisé de ses produits est recalculé
+    (colonnes remplies par 0005 avec les anciennes quantités).
+    """
+    Lot = apps.get_model('catalog', 'Lot')
+    Product = apps.get_model('catalog', 'Product')
+    StockMovement = apps.get_model('catalog', 'StockMovement')
+
+    clamped = list(
+        Lot.objects.filter(remaining_quantity__gt=F('quantity')).values_list(
+            'pk', 'product_id', 'quantity', 'remaining_quantity',
+        )
+    )
+    if not clamped:
+        return
+
+    Lot.objects.filter(pk__in=[pk for pk, *_ in clamped]).update(remaining_quantity=F('quantity'))
+    # bulk_create : le signal post_save (qui réappliquerait l'ajustement) n'est pas émis
+    StockMovement.objects.bulk_create(
+        StockMovement(
+            lot_id=pk,
+            movement_type='adjustment',
+            quantity=quantity,
+            source='Migration 0007',
+            comment=f'Quantité restante {remaining} ramenée à la quantité initiale {quantity}',
+        )
+        for pk, _, quantity, remaining in clamped
+    )
+
+    today = date.today()
+    active_lots = Lot.objects.filter(product=OuterRef('pk'), is_active=True).order_by()
+
+    def lot_sum(lots):
+        return Coalesce(
+            Subquery(
+                lots.values('product').annotate(total=Sum('remaining_quantity')).values('total'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Product.objects.filter(pk__in={product_id for _, product_id, *_ in clamped}).update(
+        stock_quantity=lot_sum(active_lots.filter(expiration_date__gt=today)),
+        expired_stock_quantity=lot_sum(active_lots.filter(expiration_date__lte=today)),
+    )
+    print(f'\n  {len(clamped)} lot(s) : quantité restante ramenée à la quantité initiale.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_lot_prod_active_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_remaining_quantity, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='lot',
+            constraint=models.CheckConstraint(condition=models.Q(remaining_quantity__lte=models.F('quantity')), name='lot_remaining_lte_quantity'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-15 11:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_supplier_name(apps, schema_editor):
+    PurchaseOrder = apps.get_model('catalog', 'PurchaseOrder')
+    Supplier = apps.get_model('catalog', 'Supplier')
+    PurchaseOrder.objects.update(
+        supplier_name=Subquery(Supplier.objects.filter(pk=OuterRef('supplier_id')).values('name')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_lot_remaining_lte_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='supplier_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Nom du fournisseur'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_supplier_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-15 12:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_product_name(apps, schema_editor):
+    Lot = apps.get_model('catalog', 'Lot')
+    Product = apps.get_model('catalog', 'Product')
+    Lot.objects.update(
+        product_name=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('name')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_purchaseorder_supplier_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lot',
+            name='product_name',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Nom du produit'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_product_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_lot_product_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(condition=models.Q(('is_active', True), ('remaining_quantity__gt', 0)), fields=['product', 'expiration_date', 'created_at'], name='lot_fefo_idx'),
+        ),
+    ]
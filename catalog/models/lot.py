@@ -6,7 +6,9 @@ from datetime import date
 from decimal import Decimal
 
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from pharmacy_pos.common.models import TimeStampedModel
 
@@ -17,6 +19,40 @@ from .supplier import PurchaseOrder
 # StockMovement est importé dans les méthodes qui en ont besoin
 
 
+class LotManager(models.Manager):
+    """
+    Création de lots : remaining_quantity démarre à la quantité reçue.
+    """
+
+    @staticmethod
+    def start_full(lot: 'Lot') -> 'Lot':
+        """
+        Seul endroit où un nouveau lot reçoit sa quantité restante
+        (create_lot, bulk_create_lots, admin et import).
+        """
+        lot.remaining_quantity = lot.quantity
+        return lot
+
+    def create_lot(self, **kwargs) -> 'Lot':
+        lot = self.start_full(self.model(**kwargs))
+        lot.save(force_insert=True)
+        return lot
+
+    def bulk_create_lots(self, lots, batch_size: int = 500):
+        """
+        Insère une réception complète en une fois (bulk_create ne passe pas par
+        Lot.save) puis recalcule le stock des produits concernés.
+        """
+        lots = list(lots)
+        for lot in lots:
+            self.start_full(lot)
+            lot.product_name = lot.product.name
+        with transaction.atomic():
+            created = self.bulk_create(lots, batch_size=batch_size)
+            Product.refresh_stock_fields({lot.product_id for lot in lots})
+        return created
+
+
 class Lot(TimeStampedModel):
     purchase_order = models.ForeignKey(
         PurchaseOrder,
@@ -52,35 +88,123 @@ class Lot(TimeStampedModel):
         validators=[MinValueValidator(Decimal('0.00'))],
     )
     batch_number = models.CharField('Numéro de lot', max_length=100, blank=True)
+    # Copie du nom du produit pour __str__ (listes déroulantes, mouvements de stock)
+    product_name = models.CharField('Nom du produit', max_length=255, editable=False)
     is_active = models.BooleanField('Actif', default=True)
 
+    objects = LotManager()
+
     class Meta:
         verbose_name = 'Lot'
         verbose_name_plural = 'Lots'
         ordering = ['expiration_date', 'created_at']
         indexes = [
-            models.Index(fields=['product', 'expiration_date', 'is_active']),
+            models.Index(fields=['product', 'is_active', 'expiration_date'], name='lot_prod_active_exp'),
+            # Dernier lot actif par produit (prix de référence)
+            models.Index(fields=['product', 'is_active', '-created_at'], name='lot_prod_active_created_idx'),
             models.Index(fields=['is_active', 'expiration_date']),
+            # Sélection FEFO : lots actifs non épuisés d'un produit, déjà triés
+            models.Index(
+                fields=['product', 'expiration_date', 'created_at'],
+                name='lot_fefo_idx',
+                condition=Q(is_active=True, remaining_quantity__gt=0),
+            ),
+        ]
+        constraints = [
+            # remaining_quantity >= 0 est déjà garanti par PositiveIntegerField
+            models.CheckConstraint(
+                condition=Q(remaining_quantity__lte=F('quantity')),
+                name='lot_remaining_lte_quantity',
+            ),
         ]
 
     def __str__(self) -> str:
         batch_info = f' - Lot {self.batch_number}' if self.batch_number else ''
-        return f'{self.product.name}{batch_info} (Exp: {self.expiration_date})'
+        return f'{self.product_name}{batch_info} (Exp: {self.expiration_date})'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Produit chargé : un lot déplacé vers un autre produit recalcule les deux
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        return instance
 
     def save(self, *args, **kwargs) -> None:
         """
-        Initialise remaining_quantity à quantity si c'est une nouvelle instance.
+        Répercute le lot sur les colonnes de stock du produit.
+        remaining_quantity n'est pas modifiée ici : toute création la fixe
+        d'abord par Lot.objects.start_full.
         """
-        if self.pk is None:
-            self.remaining_quantity = self.quantity
-        super().save(*args, **kwargs)
+        creating = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'product' in update_fields:
+            self.product_name = self.product.name
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = {*update_fields, 'product_name'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if creating:
+                self._register_on_product()
+            elif update_fields is None or not _QUANTITY_FIELDS.issuperset(update_fields):
+                # Modification libre (admin...) : statut, date ou produit ont pu changer
+                product_ids = {self.product_id, getattr(self, '_loaded_product_id', None)}
+                product_ids.discard(None)
+                Product.refresh_stock_fields(product_ids)
+            # Les ajustements de quantité seule sont reportés par adjust_quantity
+        self._loaded_product_id = self.product_id
+        self._invalidate_product_stock_cache()
+
+    def stock_field(self):
+        """
+        Colonne de Product qui comptabilise ce lot (None pour un lot inactif).
+        """
+        if not self.is_active:
+            return None
+        return 'expired_stock_quantity' if self.is_expired else 'stock_quantity'
+
+    def push_stock_delta(self, quantity_delta: int) -> None:
+        """
+        Reporte une variation de remaining_quantity sur le stock du produit.
+        """
+        field = self.stock_field()
+        if field and quantity_delta:
+            Product.objects.filter(pk=self.product_id).update(**{field: F(field) + quantity_delta})
+
+    def _register_on_product(self) -> None:
+        updates = {}
+        field = self.stock_field()
+        if field:
+            updates[field] = F(field) + self.remaining_quantity
+        if self.is_active:
+            # Le lot qui vient d'être créé est le dernier reçu
+            updates['last_purchase_price'] = self.purchase_price
+            updates['last_sale_price'] = self.sale_price
+        if updates:
+            Product.objects.filter(pk=self.product_id).update(**updates)
+
+    def _invalidate_product_stock_cache(self) -> None:
+        """
+        Invalide le cache de stock du produit s'il est déjà chargé (sans requête).
+        """
+        if Lot.product.is_cached(self):
+            self.product.invalidate_stock_cache()
 
     @property
     def is_expired(self) -> bool:
         """
         Vérifie si le lot est expiré.
+        Utilise l'annotation _is_expired si le queryset l'a calculée (ex. LotAdmin).
+        """
+        annotated = self.__dict__.get('_is_expired')
+        if annotated is not None:
+            return annotated
+        return self.is_expired_as_of(date.today())
+
+    def is_expired_as_of(self, today: date) -> bool:
         """
-        return self.expiration_date <= date.today()
+        Vérifie si le lot est expiré à la date donnée (date calculée une fois par l'appelant).
+        """
+        return self.expiration_date <= today
 
     @property
     def is_exhausted(self) -> bool:
@@ -89,10 +213,45 @@ class Lot(TimeStampedModel):
         """
         return self.remaining_quantity == 0
 
-    def adjust_quantity(self, quantity_delta: int) -> None:
+    def adjust_quantity(self, quantity_delta: int, save: bool = True) -> None:
         """
         Ajuste la quantité restante du lot.
+        Avec save=True, l'ajustement est un UPDATE unique en F() : pas de mise
+        à jour perdue entre deux ventes concurrentes. Les bornes
+        0 <= remaining_quantity <= quantity sont garanties par les contraintes
+        de la base ; une violation est convertie en ValueError.
+        Avec save=False, seule l'instance est modifiée : l'appelant se charge
+        des écritures groupées (lot et stock du produit).
+        Une variation nulle (ex. ajustement à la quantité actuelle) n'écrit rien.
         """
+        if not quantity_delta:
+            return
+        if not save:
+            self._check_quantity_bounds(quantity_delta)
+            self.remaining_quantity += quantity_delta
+            self._invalidate_product_stock_cache()
+            return
+
+        try:
+            with transaction.atomic():
+                Lot.objects.filter(pk=self.pk).update(
+                    remaining_quantity=F('remaining_quantity') + quantity_delta,
+                    updated_at=timezone.now(),
+                )
+                self.push_stock_delta(quantity_delta)
+        except IntegrityError as exc:
+            # Relire la quantité réelle pour un message d'erreur exact
+            self.refresh_from_db(fields=['remaining_quantity'])
+            try:
+                self._check_quantity_bounds(quantity_delta)
+            except ValueError as error:
+                raise error from exc
+            raise
+        # Valeur indicative : la base fait foi en cas d'écritures concurrentes
+        self.remaining_quantity += quantity_delta
+        self._invalidate_product_stock_cache()
+
+    def _check_quantity_bounds(self, quantity_delta: int) -> None:
         new_quantity = self.remaining_quantity + quantity_delta
         if new_quantity < 0:
             raise ValueError(
@@ -106,6 +265,5 @@ class Lot(TimeStampedModel):
                 f'Quantité initiale: {self.quantity}, '
                 f'Tentative: {new_quantity}'
             )
-        self.remaining_quantity = new_quantity
-        self.save(update_fields=['remaining_quantity', 'updated_at'])
 
+_QUANTITY_FIELDS = frozenset({'remaining_quantity', 'updated_at'})
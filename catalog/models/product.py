@@ -5,9 +5,12 @@ Modèle pour les produits.
 from datetime import date
 from decimal import Decimal
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import BooleanField, Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Upper
+from django.utils.functional import cached_property
 
 from pharmacy_pos.common.models import TimeStampedModel
 
@@ -41,81 +44,229 @@ class Product(TimeStampedModel):
     )
     notes = models.TextField('Notes', blank=True)
     image = models.ImageField('Image', upload_to='products/', blank=True, null=True)
+    # Agrégats dénormalisés des lots, tenus à jour par Lot et StockMovement.
+    # Le passage d'un lot en péremption n'écrit rien : refresh_product_stock
+    # (à lancer chaque jour) recalcule ces colonnes depuis les lots.
+    stock_quantity = models.IntegerField('Stock disponible', default=0, editable=False)
+    expired_stock_quantity = models.IntegerField('Stock expiré', default=0, editable=False)
+    last_purchase_price = models.DecimalField(
+        'Dernier prix d\'achat',
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+    )
+    last_sale_price = models.DecimalField(
+        'Dernier prix de vente',
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Produit'
         verbose_name_plural = 'Produits'
         ordering = ['name']
         unique_together = ('name', 'supplier')
+        indexes = [
+            # Liste admin filtrée par catégorie, triée par nom
+            models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+            # Recherches icontains (UPPER(col) LIKE ...) de l'admin et de l'API
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='product_name_trgm_idx'),
+            GinIndex(OpClass(Upper('barcode'), name='gin_trgm_ops'), name='product_barcode_trgm_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.name} ({self.barcode})'
 
+    def save(self, *args, **kwargs) -> None:
+        """
+        Une sauvegarde complète d'un produit existant (admin, import) n'écrit
+        pas les colonnes de stock : les valeurs chargées en mémoire écraseraient
+        les variations en F() validées entre-temps. Seuls les UPDATE en F() et
+        refresh_stock_fields les tiennent à jour.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in STOCK_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def purchase_price(self) -> Decimal:
         """
         Prix d'achat basé sur le dernier lot reçu.
         """
-        from .lot import Lot
-        
-        last_lot = Lot.objects.filter(
-            product=self,
-            is_active=True,
-        ).order_by('-created_at').first()
-        
-        if last_lot:
-            return last_lot.purchase_price
-        return Decimal('0.00')
+        if '_last_lot' in self.__dict__:
+            lot = self._last_lot
+            return lot.purchase_price if lot else Decimal('0.00')
+        return self.last_purchase_price
 
     @property
     def sale_price(self) -> Decimal:
         """
         Prix de vente basé sur le dernier lot reçu.
         """
-        from .lot import Lot
-        
-        last_lot = Lot.objects.filter(
-            product=self,
-            is_active=True,
-        ).order_by('-created_at').first()
-        
-        if last_lot:
-            return last_lot.sale_price
-        return Decimal('0.00')
+        if '_last_lot' in self.__dict__:
+            lot = self._last_lot
+            return lot.sale_price if lot else Decimal('0.00')
+        return self.last_sale_price
 
     @property
     def total_stock(self) -> int:
         """
         Quantité totale en stock (non expirée).
+        Utilise l'annotation _total_stock si le queryset l'a calculée
+        (ex. ProductAdmin), sinon la colonne dénormalisée.
         """
-        from .lot import Lot
-        
-        today = date.today()
-        return Lot.objects.filter(
-            product=self,
-            is_active=True,
-            expiration_date__gt=today,
-        ).aggregate(total=Sum('remaining_quantity'))['total'] or 0
+        annotated = self.__dict__.get('_total_stock')
+        return self.stock_quantity if annotated is None else annotated
 
     @property
     def total_expired_stock(self) -> int:
         """
         Quantité totale expirée mais pas encore sortie du stock.
+        Utilise l'annotation _total_expired_stock si elle est présente.
         """
-        from .lot import Lot
-        
-        today = date.today()
-        return Lot.objects.filter(
-            product=self,
-            is_active=True,
-            expiration_date__lte=today,
-            remaining_quantity__gt=0,
-        ).aggregate(total=Sum('remaining_quantity'))['total'] or 0
+        annotated = self.__dict__.get('_total_expired_stock')
+        return self.expired_stock_quantity if annotated is None else annotated
 
-    @property
+    @cached_property
     def is_below_threshold(self) -> bool:
         """
         Vérifie si le stock total est en dessous du seuil d'alerte.
+        Avec le seuil par défaut (0), seuls les produits en rupture sont signalés.
+        Aucune requête : annotation ou colonne dénormalisée.
+        Mis en cache sur l'instance, invalidé par invalidate_stock_cache().
         """
+        annotated = self.__dict__.get('_is_below_threshold')
+        if annotated is not None:
+            return annotated
         return self.total_stock <= self.stock_threshold
 
+    def invalidate_stock_cache(self) -> None:
+        """
+        Oublie les valeurs de stock mises en cache sur l'instance.
+        Les colonnes dénormalisées redeviennent différées : elles seront relues
+        en base au prochain accès seulement.
+        """
+        for name in ('is_below_threshold', '_last_lot', *STOCK_FIELDS, *STOCK_ANNOTATIONS):
+            self.__dict__.pop(name, None)
+
+    @staticmethod
+    def last_active_lots(product_ids=None):
+        """
+        Dernier lot actif de chaque produit, en une requête (DISTINCT ON).
+        """
+        from .lot import Lot
+
+        lots = Lot.objects.filter(is_active=True)
+        if product_ids is not None:
+            lots = lots.filter(product_id__in=product_ids)
+        return lots.order_by('product_id', '-created_at').distinct('product_id')
+
+    @classmethod
+    def attach_last_lots(cls, products):
+        """
+        Associe à chaque produit de la liste son dernier lot actif (_last_lot)
+        en une seule requête ; purchase_price et sale_price le lisent ensuite.
+        """
+        products = list(products)
+        lots = {lot.product_id: lot for lot in cls.last_active_lots([product.pk for product in products])}
+        for product in products:
+            product._last_lot = lots.get(product.pk)
+        return products
+
+    @classmethod
+    def with_stock(cls, queryset=None, today=None):
+        """
+        Annote _total_stock, _total_expired_stock et _is_below_threshold
+        calculés depuis les lots, en une seule requête agrégée.
+        Les propriétés total_stock, total_expired_stock et is_below_threshold
+        utilisent ces annotations quand elles sont présentes.
+        """
+        today = today or date.today()
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.annotate(
+            _total_stock=Coalesce(
+                Sum(
+                    'lots__remaining_quantity',
+                    filter=Q(lots__is_active=True, lots__expiration_date__gt=today),
+                ),
+                0,
+            ),
+            _total_expired_stock=Coalesce(
+                Sum(
+                    'lots__remaining_quantity',
+                    filter=Q(
+                        lots__is_active=True,
+                        lots__expiration_date__lte=today,
+                        lots__remaining_quantity__gt=0,
+                    ),
+                ),
+                0,
+            ),
+        ).annotate(
+            _is_below_threshold=Case(
+                When(_total_stock__lte=F('stock_threshold'), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+        )
+
+    @classmethod
+    def refresh_stock_fields(cls, product_ids=None, today=None) -> int:
+        """
+        Recalcule les colonnes dénormalisées depuis les lots.
+        Sans product_ids, tous les produits sont recalculés.
+        """
+        from .lot import Lot
+
+        today = today or date.today()
+        active_lots = Lot.objects.filter(product=OuterRef('pk'), is_active=True).order_by()
+
+        def lot_sum(lots):
+            return Coalesce(
+                Subquery(
+                    lots.values('product').annotate(total=Sum('remaining_quantity')).values('total'),
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            )
+
+        products = cls.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        updated = products.update(
+            stock_quantity=lot_sum(active_lots.filter(expiration_date__gt=today)),
+            expired_stock_quantity=lot_sum(active_lots.filter(expiration_date__lte=today)),
+        )
+
+        # Dernier lot actif de chaque produit en une requête (DISTINCT ON) :
+        # il fournit les deux prix à la fois.
+        last_prices = {
+            product_id: (purchase_price, sale_price)
+            for product_id, purchase_price, sale_price in cls.last_active_lots(product_ids).values_list(
+                'product_id', 'purchase_price', 'sale_price',
+            )
+        }
+        no_price = (Decimal('0.00'), Decimal('0.00'))
+        changed = [
+            cls(pk=pk, last_purchase_price=prices[0], last_sale_price=prices[1])
+            for pk, *current in products.values_list('pk', 'last_purchase_price', 'last_sale_price')
+            if tuple(current) != (prices := last_prices.get(pk, no_price))
+        ]
+        cls.objects.bulk_update(changed, ['last_purchase_price', 'last_sale_price'], batch_size=1000)
+        return updated
+
+
+STOCK_FIELDS = ('stock_quantity', 'expired_stock_quantity', 'last_purchase_price', 'last_sale_price')
+STOCK_ANNOTATIONS = ('_total_stock', '_total_expired_stock', '_is_below_threshold')
+
@@ -2,15 +2,27 @@
 Modèle pour les mouvements de stock.
 """
 
+from collections import defaultdict
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, List, Optional
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, IntegerField, Value, When
 from django.utils import timezone
 
 from pharmacy_pos.common.models import TimeStampedModel
 
 from .lot import Lot
+from .product import Product
+
+
+class StockMovementManager(models.Manager):
+    """
+    Charge le lot avec chaque mouvement (son product_name sert à __str__).
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('lot')
 
 
 class StockMovement(TimeStampedModel):
@@ -35,39 +47,113 @@ class StockMovement(TimeStampedModel):
     movement_date = models.DateTimeField('Date du mouvement', default=timezone.now)
     comment = models.TextField('Commentaire', blank=True)
 
+    objects = StockMovementManager()
+
     class Meta:
         verbose_name = 'Mouvement de stock'
         verbose_name_plural = 'Mouvements de stock'
         ordering = ['-movement_date']
         indexes = [
             models.Index(fields=['lot', '-movement_date']),
+            models.Index(fields=['-movement_date', 'movement_type'], name='stockmvt_date_type_idx'),
         ]
 
     def __str__(self) -> str:
-        return f'{self.get_movement_type_display()} - {self.lot.product.name} ({self.quantity})'
+        movement_label = _MOVEMENT_LABELS.get(self.movement_type, self.movement_type)
+        # Pas de requête supplémentaire si le lot n'est pas déjà chargé
+        if StockMovement.lot.is_cached(self):
+            target = self.lot.product_name
+        else:
+            target = f'Lot #{self.lot_id}'
+        return f'{movement_label} - {target} ({self.quantity})'
 
     def save(self, *args, **kwargs) -> None:
-        """
-        Applique le mouvement au lot si c'est une nouvelle instance.
-        """
-        is_new = self.pk is None
-        skip_lot_update = getattr(self, '_skip_lot_update', False)
-        if is_new and not skip_lot_update:
-            self.apply_to_lot()
-        super().save(*args, **kwargs)
+        # Le mouvement et son application au lot (signal post_save)
+        # sont validés ou annulés ensemble.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-    def apply_to_lot(self) -> None:
+    def apply_to_lot(self, save: bool = True) -> None:
         """
-        Applique le mouvement au lot.
+        Applique le mouvement au lot via Lot.adjust_quantity : un seul UPDATE
+        du lot par mouvement (plus de second lot.save()).
+        Avec save=False, le lot est seulement modifié en mémoire.
         """
         if self.movement_type == self.MovementType.ADJUSTMENT:
-            # Pour un ajustement, on fixe la quantité restante
-            self.lot.remaining_quantity = self.quantity
+            # Pour un ajustement, on fixe la quantité restante : le delta est
+            # calculé sur la valeur verrouillée en base, pas sur l'instance
+            if save:
+                self.lot.remaining_quantity = (
+                    Lot.objects.select_for_update()
+                    .values_list('remaining_quantity', flat=True)
+                    .get(pk=self.lot_id)
+                )
+            quantity_delta = self.quantity - self.lot.remaining_quantity
         elif self.movement_type == self.MovementType.IN:
             # Pour une entrée, on ajoute à la quantité restante
-            self.lot.adjust_quantity(self.quantity)
+            quantity_delta = self.quantity
         else:  # OUT
             # Pour une sortie, on soustrait de la quantité restante
-            self.lot.adjust_quantity(-self.quantity)
-        self.lot.save(update_fields=['remaining_quantity', 'updated_at'])
+            quantity_delta = -self.quantity
+        self.lot.adjust_quantity(quantity_delta, save=save)
+
+    @classmethod
+    def bulk_apply(cls, movements: Iterable['StockMovement'], batch_size: int = 1000) -> List['StockMovement']:
+        """
+        Applique une série de mouvements et les enregistre en écritures groupées :
+        un seul UPDATE en F() pour tous les lots (variation choisie par CASE,
+        les lots de même delta partageant une branche), un UPDATE par produit
+        concerné et un bulk_create pour les mouvements, au lieu d'écritures
+        par mouvement.
+        """
+        movements = list(movements)
+        lots = {}
+        initial_quantities = {}
+        for movement in movements:
+            # Une seule instance par lot pour cumuler les mouvements successifs
+            lot = lots.setdefault(movement.lot_id, movement.lot)
+            initial_quantities.setdefault(lot.pk, lot.remaining_quantity)
+            movement.lot = lot
+            movement.apply_to_lot(save=False)
+
+        lots_by_delta = defaultdict(list)
+        product_deltas = {}
+        for lot in lots.values():
+            quantity_delta = lot.remaining_quantity - initial_quantities[lot.pk]
+            if not quantity_delta:
+                continue
+            lots_by_delta[quantity_delta].append(lot.pk)
+            field = lot.stock_field()
+            if field:
+                deltas = product_deltas.setdefault(lot.product_id, {})
+                deltas[field] = deltas.get(field, 0) + quantity_delta
+
+        now = timezone.now()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    if lots_by_delta:
+                        # Bornes garanties par les contraintes de Lot
+                        Lot.objects.filter(pk__in=[pk for ids in lots_by_delta.values() for pk in ids]).update(
+                            remaining_quantity=F('remaining_quantity') + Case(
+                                *(
+                                    When(pk__in=lot_ids, then=Value(quantity_delta))
+                                    for quantity_delta, lot_ids in lots_by_delta.items()
+                                ),
+                                output_field=IntegerField(),
+                            ),
+                            updated_at=now,
+                        )
+            except IntegrityError as exc:
+                raise ValueError(
+                    'Quantité des lots modifiée entre-temps : mouvements de stock annulés.'
+                ) from exc
+            for product_id, deltas in product_deltas.items():
+                updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+                if updates:
+                    Product.objects.filter(pk=product_id).update(**updates)
+            # bulk_create n'appelle pas save() : les lots ne sont pas réajustés
+            return cls.objects.bulk_create(movements, batch_size=batch_size)
+
 
+_MOVEMENT_LABELS = dict(StockMovement.MovementType.choices)
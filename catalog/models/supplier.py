@@ -44,6 +44,8 @@ class PurchaseOrder(TimeStampedModel):
         default=Status.DRAFT,
     )
     notes = models.TextField('Notes', blank=True)
+    # Copie du nom du fournisseur pour __str__ (listes déroulantes, autocomplétion)
+    supplier_name = models.CharField('Nom du fournisseur', max_length=255, editable=False, db_index=True)
 
     class Meta:
         verbose_name = 'Commande d\'achat'
@@ -51,5 +53,13 @@ class PurchaseOrder(TimeStampedModel):
         ordering = ['-order_date']
 
     def __str__(self) -> str:
-        return f'Commande #{self.pk or "—"} - {self.supplier.name}'
+        return f'Commande #{self.pk or "—"} - {self.supplier_name}'
+
+    def save(self, *args, **kwargs) -> None:
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'supplier' in update_fields:
+            self.supplier_name = self.supplier.name
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'supplier_name'}
+        super().save(*args, **kwargs)
 
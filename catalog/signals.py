@@ -0,0 +1,52 @@
+"""
+Signaux du catalogue.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Lot, Product, PurchaseOrder, StockMovement, Supplier
+
+
+@receiver(post_save, sender=StockMovement)
+def apply_new_stock_movement(sender, instance: StockMovement, created: bool, raw: bool, **kwargs) -> None:
+    """
+    Applique un nouveau mouvement à son lot.
+    Les chargements de fixtures (raw) sont ignorés ; les écritures groupées passent
+    par bulk_create / StockMovement.bulk_apply, qui n'émettent pas ce signal.
+    """
+    if not created or raw:
+        return
+    instance.apply_to_lot()
+
+
+@receiver(post_delete, sender=Lot)
+def refresh_stock_after_lot_delete(sender, instance: Lot, **kwargs) -> None:
+    """
+    Recalcule le stock dénormalisé du produit d'un lot supprimé.
+    """
+    Product.refresh_stock_fields([instance.product_id])
+
+
+@receiver(post_save, sender=Supplier)
+def propagate_supplier_name(sender, instance: Supplier, created: bool, raw: bool, **kwargs) -> None:
+    """
+    Répercute un changement de nom sur les commandes d'achat, en un seul UPDATE.
+    """
+    if created or raw:
+        return
+    PurchaseOrder.objects.filter(supplier=instance).exclude(supplier_name=instance.name).update(
+        supplier_name=instance.name,
+    )
+
+
+@receiver(post_save, sender=Product)
+def propagate_product_name(sender, instance: Product, created: bool, raw: bool, **kwargs) -> None:
+    """
+    Répercute un changement de nom sur les lots du produit, en un seul UPDATE.
+    """
+    if created or raw:
+        return
+    Lot.objects.filter(product=instance).exclude(product_name=instance.name).update(
+        product_name=instance.name,
+    )
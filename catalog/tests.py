@@ -1,3 +1,205 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Category, DosageForm, Lot, Product, PurchaseOrder, StockMovement, Supplier
+
+
+class CatalogTestCase(TestCase):
+    """
+    Jeu de données commun : un fournisseur, une commande et deux produits.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Antalgiques', code='ANT')
+        cls.dosage_form = DosageForm.objects.create(name='Comprimé')
+        cls.supplier = Supplier.objects.create(name='Fournisseur test')
+        cls.purchase_order = PurchaseOrder.objects.create(supplier=cls.supplier)
+        cls.product = cls.create_product('Paracétamol 500 mg', '3400000000011')
+        cls.other_product = cls.create_product('Ibuprofène 200 mg', '3400000000028')
+
+    @classmethod
+    def create_product(cls, name, barcode):
+        return Product.objects.create(
+            name=name,
+            barcode=barcode,
+            category=cls.category,
+            dosage_form=cls.dosage_form,
+            supplier=cls.supplier,
+        )
+
+    def create_lot(self, product=None, quantity=10, days_to_expiry=365, **kwargs):
+        return Lot.objects.create_lot(
+            purchase_order=self.purchase_order,
+            product=product or self.product,
+            quantity=quantity,
+            expiration_date=date.today() + timedelta(days=days_to_expiry),
+            purchase_price=Decimal('100.00'),
+            sale_price=Decimal('150.00'),
+            **kwargs,
+        )
+
+    def assertStockConsistent(self, product, stock, expired_stock=0):
+        """
+        Les colonnes dénormalisées valent les agrégats calculés depuis les lots.
+        """
+        product.refresh_from_db()
+        annotated = Product.with_stock(Product.objects.filter(pk=product.pk)).get()
+        self.assertEqual(product.stock_quantity, stock)
+        self.assertEqual(product.expired_stock_quantity, expired_stock)
+        self.assertEqual(annotated._total_stock, stock)
+        self.assertEqual(annotated._total_expired_stock, expired_stock)
+
+
+class ProductStockTests(CatalogTestCase):
+    def test_create_lot(self):
+        lot = self.create_lot(quantity=10)
+        self.create_lot(quantity=4, days_to_expiry=-1)
+
+        self.assertEqual(lot.remaining_quantity, 10)
+        self.assertStockConsistent(self.product, stock=10, expired_stock=4)
+
+    def test_bulk_create_lots(self):
+        Lot.objects.bulk_create_lots([
+            Lot(
+                purchase_order=self.purchase_order,
+                product=product,
+                quantity=quantity,
+                expiration_date=date.today() + timedelta(days=30),
+                purchase_price=Decimal('100.00'),
+                sale_price=Decimal('150.00'),
+            )
+            for product, quantity in ((self.product, 6), (self.other_product, 8))
+        ])
+
+        self.assertStockConsistent(self.product, stock=6)
+        self.assertStockConsistent(self.other_product, stock=8)
+
+    def test_move_lot_to_other_product(self):
+        lot = Lot.objects.get(pk=self.create_lot(quantity=10).pk)
+
+        lot.product = self.other_product
+        lot.save()
+
+        self.assertEqual(lot.product_name, self.other_product.name)
+        self.assertStockConsistent(self.product, stock=0)
+        self.assertStockConsistent(self.other_product, stock=10)
+
+    def test_deactivate_lot(self):
+        lot = self.create_lot(quantity=10)
+        self.create_lot(quantity=3)
+
+        lot.is_active = False
+        lot.save()
+
+        self.assertStockConsistent(self.product, stock=3)
+
+    def test_delete_lot(self):
+        lot = self.create_lot(quantity=10)
+        self.create_lot(quantity=3)
+
+        lot.delete()
+
+        self.assertStockConsistent(self.product, stock=3)
+
+    def test_full_product_save_keeps_stock(self):
+        # Instance chargée avant la réception : sa sauvegarde complète
+        # ne doit pas réécrire l'ancien stock
+        product = Product.objects.get(pk=self.product.pk)
+        self.create_lot(quantity=10)
+
+        product.name = 'Paracétamol 1 g'
+        product.save()
+
+        self.assertStockConsistent(product, stock=10)
+        self.assertEqual(Lot.objects.get(product=product).product_name, 'Paracétamol 1 g')
+
+    def test_refresh_stock_fields(self):
+        self.create_lot(quantity=10)
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0, expired_stock_quantity=7)
+
+        Product.refresh_stock_fields([self.product.pk])
+
+        self.assertStockConsistent(self.product, stock=10)
+
+
+class StockMovementTests(CatalogTestCase):
+    def setUp(self):
+        self.lot = self.create_lot(quantity=10)
+
+    def create_movement(self, movement_type, quantity):
+        return StockMovement.objects.create(
+            lot=self.lot,
+            movement_type=movement_type,
+            quantity=quantity,
+            source='Test',
+        )
+
+    def assertRemaining(self, remaining):
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.remaining_quantity, remaining)
+        self.assertStockConsistent(self.product, stock=remaining)
+
+    def test_out_then_in(self):
+        self.create_movement(StockMovement.MovementType.OUT, 4)
+        self.assertRemaining(6)
+
+        self.create_movement(StockMovement.MovementType.IN, 3)
+        self.assertRemaining(9)
+
+    def test_adjustment(self):
+        self.create_movement(StockMovement.MovementType.OUT, 4)
+
+        self.create_movement(StockMovement.MovementType.ADJUSTMENT, 8)
+
+        self.assertRemaining(8)
+
+    def test_out_beyond_remaining_raises(self):
+        with self.assertRaises(ValueError):
+            self.create_movement(StockMovement.MovementType.OUT, 11)
+
+        self.assertRemaining(10)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_in_beyond_quantity_raises(self):
+        self.create_movement(StockMovement.MovementType.OUT, 2)
+
+        with self.assertRaises(ValueError):
+            self.create_movement(StockMovement.MovementType.IN, 3)
+
+        self.assertRemaining(8)
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_adjustment_beyond_quantity_raises(self):
+        with self.assertRaises(ValueError):
+            self.create_movement(StockMovement.MovementType.ADJUSTMENT, 11)
+
+        self.assertRemaining(10)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_bulk_apply(self):
+        other_lot = self.create_lot(quantity=5)
+
+        StockMovement.bulk_apply([
+            StockMovement(lot=self.lot, movement_type=StockMovement.MovementType.OUT, quantity=3),
+            StockMovement(lot=self.lot, movement_type=StockMovement.MovementType.OUT, quantity=2),
+            StockMovement(lot=other_lot, movement_type=StockMovement.MovementType.OUT, quantity=1),
+        ])
+
+        other_lot.refresh_from_db()
+        self.assertEqual(other_lot.remaining_quantity, 4)
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.remaining_quantity, 5)
+        self.assertStockConsistent(self.product, stock=9)
+        self.assertEqual(StockMovement.objects.count(), 3)
+
+    def test_bulk_apply_overflow_raises(self):
+        with self.assertRaises(ValueError):
+            StockMovement.bulk_apply([
+                StockMovement(lot=self.lot, movement_type=StockMovement.MovementType.OUT, quantity=11),
+            ])
+
+        self.assertRemaining(10)
+        self.assertFalse(StockMovement.objects.exists())
@@ -9,6 +9,10 @@ from django.urls import path
 
 User = get_user_model()
 
+# Rôles autorisés, calculés une fois au chargement du module
+_DASHBOARD_ROLES = frozenset({User.Roles.ADMIN.value, User.Roles.PHARMACIST.value})
+_FINANCIAL_ROLES = frozenset({User.Roles.ADMIN.value})
+
 
 class CustomAdminSite(admin.AdminSite):
     site_header = "La Pharmacie de la Poste"
@@ -24,15 +28,15 @@ class CustomAdminSite(admin.AdminSite):
         
         # Vérifier si l'utilisateur peut voir le dashboard
         user_role = getattr(request.user, 'role', None)
-        can_view_dashboard = user_role in [User.Roles.ADMIN, User.Roles.PHARMACIST] if user_role else False
+        can_view_dashboard = user_role in _DASHBOARD_ROLES
         
         if can_view_dashboard:
             # Afficher le dashboard
             context = {
                 **self.each_context(request),
                 **extra_context,
-                'can_view_financial': user_role == User.Roles.ADMIN,
-                'can_view_products': user_role in [User.Roles.ADMIN, User.Roles.PHARMACIST],
+                'can_view_financial': user_role in _FINANCIAL_ROLES,
+                'can_view_products': can_view_dashboard,
                 'user': request.user,
                 'title': 'Dashboard',
             }
@@ -0,0 +1,48 @@
+import operator
+from functools import reduce
+
+from django.db.models import Q
+
+
+def is_autocomplete_request(request) -> bool:
+    """
+    Indique si la requête vient de la vue d'autocomplétion de l'admin.
+    """
+    match = request.resolver_match
+    return match is not None and match.url_name == 'autocomplete'
+
+
+class ChangeListDeferMixin:
+    """
+    Exclut de la liste (changelist) les colonnes volumineuses non affichées.
+    Le formulaire de modification continue de charger l'objet complet.
+    """
+    changelist_defer = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        changelist = f'{self.opts.app_label}_{self.opts.model_name}_changelist'
+        if self.changelist_defer and match is not None and match.url_name == changelist:
+            queryset = queryset.defer(*self.changelist_defer)
+        return queryset
+
+
+class IdSearchMixin:
+    """
+    Recherche exacte sur des identifiants entiers (search_id_fields) quand le
+    terme est un nombre : égalité servie par l'index de la clé, au lieu d'un
+    CAST(id AS text) LIKE '%...%' dans search_fields.
+    """
+    search_id_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        # 18 chiffres au plus : reste dans les bornes d'un bigint
+        if self.search_id_fields and term.isdigit() and len(term) <= 18:
+            value = int(term)
+            results |= queryset.filter(
+                reduce(operator.or_, (Q(**{field: value}) for field in self.search_id_fields))
+            )
+        return results, may_have_duplicates
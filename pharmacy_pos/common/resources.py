@@ -0,0 +1,49 @@
+from import_export import resources
+
+
+class ExportFieldsModelResource(resources.ModelResource):
+    """
+    Limite la requête d'export aux colonnes déclarées dans Meta.fields
+    et joint en une seule requête les relations traversées (ex. 'category__name').
+    """
+
+    def filter_export(self, queryset, **kwargs):
+        queryset = super().filter_export(queryset, **kwargs)
+        fields = self._meta.fields
+        if not fields:
+            return queryset
+        related = sorted({name.rsplit('__', 1)[0] for name in fields if '__' in name})
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*fields)
+
+
+class PrefetchedInstanceMixin:
+    """
+    Import : charge en une requête (IN) les objets existants de tout le fichier
+    au lieu d'un SELECT par ligne. Limité à un seul champ d'identification.
+    """
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self._prefetched_instances = None
+        id_fields = self.get_import_id_fields()
+        if len(id_fields) != 1:
+            return
+        field = self.fields[id_fields[0]]
+        if field.column_name not in dataset.headers:
+            return
+        values = {field.clean(row) for row in dataset.dict}
+        values.discard(None)
+        manager = self._meta.model._default_manager
+        self._prefetched_field = field
+        self._prefetched_instances = {
+            getattr(instance, field.attribute): instance
+            for instance in manager.filter(**{f'{field.attribute}__in': values})
+        }
+
+    def get_instance(self, instance_loader, row):
+        instances = getattr(self, '_prefetched_instances', None)
+        if instances is None:
+            return super().get_instance(instance_loader, row)
+        return instances.get(self._prefetched_field.clean(row))
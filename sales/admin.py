@@ -2,18 +2,40 @@ from decimal import Decimal
 
 from django import forms
 from django.contrib import admin
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from import_export import resources
+from import_export import fields
 from import_export.admin import ImportExportModelAdmin
 
+from pharmacy_pos.common.admin import ChangeListDeferMixin, IdSearchMixin
+from pharmacy_pos.common.resources import ExportFieldsModelResource, PrefetchedInstanceMixin
+
 from .models import Customer, Invoice, Payment, Sale, SaleItem, SaleItemLot
 
 
-class CustomerResource(resources.ModelResource):
+class CustomerResource(PrefetchedInstanceMixin, ExportFieldsModelResource):
+    # Horodatages exportés mais jamais importés
+    created_at = fields.Field(attribute='created_at', column_name='created_at', readonly=True)
+    updated_at = fields.Field(attribute='updated_at', column_name='updated_at', readonly=True)
+
     class Meta:
         model = Customer
         fields = ('id', 'name', 'email', 'phone', 'address', 'credit_balance', 'created_at', 'updated_at')
         export_order = ('id', 'name', 'email', 'phone', 'address', 'credit_balance', 'created_at', 'updated_at')
+        # Export lu par blocs via QuerySet.iterator (100 lignes par défaut)
+        chunk_size = 2000
+        # Import par bulk_create / bulk_update, sans calcul de diff par ligne
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        # bulk_update n'applique pas auto_now : updated_at sert aussi d'ETag
+        # à customer_credit_info
+        instance.updated_at = timezone.now()
 
 
 class HasDebtFilter(admin.SimpleListFilter):
@@ -38,11 +60,12 @@ class HasDebtFilter(admin.SimpleListFilter):
 
 
 @admin.register(Customer)
-class CustomerAdmin(ImportExportModelAdmin):
+class CustomerAdmin(ChangeListDeferMixin, ImportExportModelAdmin):
     resource_class = CustomerResource
     list_display = ('name', 'email', 'phone', 'credit_balance', 'has_debt', 'is_anonymous')
     list_filter = ('is_anonymous', HasDebtFilter)
     search_fields = ('name', 'email', 'phone')
+    changelist_defer = ('address',)
 
     @admin.display(boolean=True, description='A une dette')
     def has_debt(self, obj):
@@ -59,7 +82,7 @@ class CustomerAdmin(ImportExportModelAdmin):
         qs = super().get_queryset(request)
         # Si le filtre is_anonymous n'est pas activé, exclure les anonymes
         if 'is_anonymous__exact' not in request.GET:
-            qs = qs.filter(is_anonymous=False)
+            qs = qs.named()
         return qs
 
 
@@ -70,6 +93,10 @@ class SaleItemLotInline(admin.TabularInline):
     can_delete = False
     fields = ('lot', 'quantity', 'unit_price')
 
+    def get_queryset(self, request):
+        # Le lot en lecture seule est affiché via __str__ sur chaque ligne
+        return super().get_queryset(request).select_related('lot')
+
 
 # Inlines désactivés car React gère tout le formulaire
 # class SaleItemInline(admin.TabularInline):
@@ -86,7 +113,7 @@ class SaleItemLotInline(admin.TabularInline):
 #     extra = 0
 
 
-class SaleResource(resources.ModelResource):
+class SaleResource(ExportFieldsModelResource):
     class Meta:
         model = Sale
         fields = (
@@ -104,21 +131,57 @@ class SaleResource(resources.ModelResource):
             'updated_at',
         )
         export_order = fields
+        chunk_size = 2000
 
 
 @admin.register(Sale)
-class SaleAdmin(ImportExportModelAdmin):
+class SaleAdmin(IdSearchMixin, ChangeListDeferMixin, ImportExportModelAdmin):
     resource_class = SaleResource
     list_display = ('reference', 'sale_date', 'customer', 'get_discount_display', 'total_amount', 'amount_paid', 'balance_due', 'status')
     list_filter = ('status', 'sale_date')
-    search_fields = ('reference', 'id', 'customer__name', 'user__username')
+    list_select_related = ('customer',)
+    # Colonnes non affichées par la liste (get_discount_display ne lit que
+    # discount_type, discount_value et l'annotation _items_total)
+    changelist_defer = (
+        'notes', 'user', 'subtotal', 'tax_amount', 'discount_amount',
+        'created_at', 'updated_at', 'customer__address',
+    )
+    search_fields = ('reference', 'customer__name', 'user__username')
+    search_id_fields = ('id',)
+    # Pas de COUNT(*) de toute la table en plus du COUNT filtré
+    show_full_result_count = False
+    list_per_page = 50
     readonly_fields = ('reference', 'user', 'subtotal', 'get_discount_display', 'total_amount', 'amount_paid', 'balance_due', 'created_at', 'updated_at')
     fieldsets = (
         (_('Général'), {'fields': ('reference', 'customer', 'sale_date', 'notes')}),
         (_('Finances'), {'fields': ('subtotal', 'discount_type', 'discount_value', 'get_discount_display', 'tax_amount', 'total_amount', 'amount_paid', 'balance_due')}),
         (_('Métadonnées'), {'fields': ('user', 'status', 'created_at', 'updated_at')}),
     )
+    # Variantes du formulaire d'ajout, construites une fois
+    add_fieldsets = (
+        (_('Général'), {'fields': ('customer', 'sale_date', 'status', 'notes')}),
+    )
+    add_readonly_fields = readonly_fields + ('tax_amount',)
     
+    def get_queryset(self, request):
+        """
+        Annote le total des lignes : la remise en pourcentage de chaque ligne
+        de la liste s'affiche sans requête SUM supplémentaire.
+        """
+        items_total = (
+            SaleItem.objects.filter(sale=OuterRef('pk'))
+            .order_by()
+            .values('sale')
+            .annotate(total=Sum('line_total'))
+            .values('total')
+        )
+        return super().get_queryset(request).annotate(
+            _items_total=Coalesce(
+                Subquery(items_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+            ),
+        )
+
     def get_discount_display(self, obj):
         """Affiche la remise formatée dans la liste et les détails."""
         return obj.get_discount_display()
@@ -134,16 +197,13 @@ class SaleAdmin(ImportExportModelAdmin):
 
     def get_fieldsets(self, request, obj=None):
         if obj is None:
-            return (
-                (_('Général'), {'fields': ('customer', 'sale_date', 'status', 'notes')}),
-            )
+            return self.add_fieldsets
         return super().get_fieldsets(request, obj)
 
     def get_readonly_fields(self, request, obj=None):
-        readonly = list(super().get_readonly_fields(request, obj))
         if obj is None:
-            readonly.append('tax_amount')
-        return readonly
+            return self.add_readonly_fields
+        return super().get_readonly_fields(request, obj)
 
     def save_model(self, request, obj, form, change):
         if not obj.user_id:
@@ -166,10 +226,14 @@ class SaleAdmin(ImportExportModelAdmin):
 
 
 @admin.register(SaleItem)
-class SaleItemAdmin(ImportExportModelAdmin):
+class SaleItemAdmin(IdSearchMixin, ImportExportModelAdmin):
     list_display = ('sale', 'product', 'quantity', 'unit_price', 'line_total')
     list_filter = ('product', 'sale')
-    search_fields = ('sale__id', 'product__name', 'product__barcode')
+    list_select_related = ('sale', 'product')
+    search_fields = ('sale__reference', 'product__name', 'product__barcode')
+    search_id_fields = ('sale_id',)
+    show_full_result_count = False
+    list_per_page = 50
     inlines = [SaleItemLotInline]
 
 
@@ -177,19 +241,31 @@ class SaleItemAdmin(ImportExportModelAdmin):
 class SaleItemLotAdmin(ImportExportModelAdmin):
     list_display = ('sale_item', 'lot', 'quantity', 'unit_price')
     list_filter = ('lot__product', 'lot__expiration_date')
+    # Lot.__str__ lit product_name : inutile de joindre le produit du lot
+    list_select_related = ('sale_item__product', 'lot')
     search_fields = ('sale_item__product__name', 'lot__batch_number')
+    autocomplete_fields = ('lot',)
     readonly_fields = ('created_at', 'updated_at')
 
 
 @admin.register(Payment)
-class PaymentAdmin(ImportExportModelAdmin):
+class PaymentAdmin(IdSearchMixin, ImportExportModelAdmin):
     list_display = ('sale', 'amount', 'payment_method', 'payment_date')
     list_filter = ('payment_method', 'payment_date')
-    search_fields = ('sale__id',)
+    list_select_related = ('sale',)
+    search_fields = ('sale__reference',)
+    search_id_fields = ('sale_id',)
+    show_full_result_count = False
+    list_per_page = 50
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(ImportExportModelAdmin):
+class InvoiceAdmin(IdSearchMixin, ChangeListDeferMixin, ImportExportModelAdmin):
     list_display = ('invoice_number', 'sale', 'invoice_date', 'sent_email', 'sent_sms')
     list_filter = ('sent_email', 'sent_sms', 'invoice_date')
-    search_fields = ('invoice_number', 'sale__id')
+    list_select_related = ('sale',)
+    search_fields = ('invoice_number', 'sale__reference')
+    search_id_fields = ('sale_id',)
+    show_full_result_count = False
+    list_per_page = 50
+    changelist_defer = ('sale__notes',)
@@ -2,64 +2,86 @@
 API Views pour le formulaire de vente dynamique.
 """
 
+import base64
+import hashlib
 import json
 from decimal import Decimal
 from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import attrgetter
 
 from django.conf import settings
+from django.core.cache import cache
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
-from django.db.models import Q, Sum, Count, DateField
+from django.db.models import Q, Sum, Count, DateField, DecimalField, ExpressionWrapper, F, Max
 from django.db.models.functions import TruncDate
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
-from catalog.models import Product, Lot
-from .models import Customer, Sale, SaleItem, Payment
+from catalog.models import Product, Lot, StockMovement
+from .models import Customer, Sale, SaleItem, SaleItemLot, Payment
 from .views import generate_invoice_for_sale
 
 User = get_user_model()
 
+# Taille d'une page de customer_list
+CUSTOMER_PAGE_SIZE = 100
+
+# Durée de vie du cache de product_search
+PRODUCT_SEARCH_CACHE_SECONDS = 5
+
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def product_search(request):
     """
     Recherche de produits par nom ou code-barres.
+    Résultats mis en cache quelques secondes par terme recherché : la saisie
+    au clavier répète les mêmes requêtes. Le stock affiché peut donc avoir
+    ce retard ; la vente revérifie le stock côté serveur.
     """
     query = request.GET.get('q', '').strip()
     
     if not query:
         return JsonResponse({'products': []})
     
-    products = Product.objects.filter(
-        Q(name__icontains=query) | Q(barcode__icontains=query)
-    ).select_related('category', 'dosage_form', 'supplier')[:20]
+    # icontains ignore la casse : « para » et « PARA » partagent une entrée
+    cache_key = 'product_search:' + hashlib.md5(query.upper().encode(), usedforsecurity=False).hexdigest()
+    results = cache.get(cache_key)
+    if results is None:
+        results = _search_products(query)
+        cache.set(cache_key, results, PRODUCT_SEARCH_CACHE_SECONDS)
+    
+    return JsonResponse({'products': results})
+
+
+def _search_products(query):
+    # Stock disponible annoté et dernier lot joint : deux requêtes pour toute la liste.
+    # Seules les colonnes renvoyées sont lues, sans jointure inutile.
+    products = Product.attach_last_lots(
+        Product.with_stock(
+            Product.objects.filter(
+                Q(name__icontains=query) | Q(barcode__icontains=query)
+            ).only('id', 'name', 'barcode')
+        )[:20]
+    )
     
     results = []
-    today = date.today()
     
     for product in products:
-        # Calculer le stock disponible
-        from catalog.models import Lot
-        available_lots = Lot.objects.filter(
-            product=product,
-            is_active=True,
-            expiration_date__gt=today,
-            remaining_quantity__gt=0,
-        ).aggregate(total=Sum('remaining_quantity'))['total'] or 0
-        
         results.append({
             'id': product.id,
             'name': product.name,
             'barcode': product.barcode or '',
             'sale_price': str(product.sale_price),
-            'stock_available': available_lots,
+            'stock_available': product.total_stock,
         })
     
-    return JsonResponse({'products': results})
+    return results
 
 
 @csrf_exempt
@@ -68,13 +90,14 @@ def product_stock_info(request, product_id):
     """
     Récupère les informations de stock détaillées d'un produit.
     """
+    today = date.today()
+    
+    # Stock expiré annoté sur le produit : pas de requête d'agrégat séparée
     try:
-        product = Product.objects.get(pk=product_id)
+        product = Product.with_stock(Product.objects.filter(pk=product_id), today=today).get()
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Produit non trouvé'}, status=404)
     
-    today = date.today()
-    
     # Lots disponibles (non expirés)
     available_lots = Lot.objects.filter(
         product=product,
@@ -96,14 +119,6 @@ def product_stock_info(request, product_id):
         })
         total_available += lot.remaining_quantity
     
-    # Stock expiré
-    expired_lots = Lot.objects.filter(
-        product=product,
-        is_active=True,
-        expiration_date__lte=today,
-        remaining_quantity__gt=0,
-    ).aggregate(total=Sum('remaining_quantity'))['total'] or 0
-    
     # Prix de vente (basé sur le dernier lot)
     sale_price = product.sale_price
     
@@ -112,13 +127,91 @@ def product_stock_info(request, product_id):
         'product_name': product.name,
         'sale_price': str(sale_price),
         'total_available': total_available,
-        'expired_stock': expired_lots,
+        'expired_stock': product.total_expired_stock,
         'stock_threshold': product.stock_threshold,
         'is_below_threshold': total_available <= product.stock_threshold,
         'available_lots': lots_info,
     })
 
 
+def _available_lots(product, today):
+    """
+    Lots vendables du produit dans l'ordre FEFO. La valeur de chaque lot
+    (prix de vente x quantité restante) est calculée par la base.
+    """
+    return _sellable_lots(today).filter(product=product).order_by('expiration_date', 'created_at')
+
+
+def _available_lots_by_product(product_ids, today):
+    """
+    Lots vendables de plusieurs produits en une seule requête, groupés par
+    produit, chaque groupe dans l'ordre FEFO (index lot_fefo_idx).
+    """
+    lots = _sellable_lots(today).filter(product_id__in=product_ids).order_by(
+        'product_id', 'expiration_date', 'created_at',
+    )
+    return {product_id: list(group) for product_id, group in groupby(lots, key=attrgetter('product_id'))}
+
+
+def _sellable_lots(today):
+    """
+    Lots actifs, non expirés et non épuisés, annotés de leur valeur.
+    """
+    return SaleItem.available_lots_queryset(today).annotate(
+        stock_value=ExpressionWrapper(
+            F('sale_price') * F('remaining_quantity'),
+            output_field=DecimalField(max_digits=24, decimal_places=2),
+        ),
+    )
+
+
+def _with_restored_lots(lots, existing_item, today):
+    """
+    Lots vendables du produit tels qu'ils seront une fois la ligne existante
+    de la vente annulée : les quantités qu'elle a prélevées sont rendues à
+    leurs lots, en mémoire seulement. Les lots renvoyés restent dans l'ordre FEFO.
+    """
+    if existing_item is None:
+        return lots
+    merged = {lot.pk: lot for lot in lots}
+    for sale_item_lot in existing_item.lot_items.all():
+        lot = sale_item_lot.lot
+        if not lot.is_active or lot.is_expired_as_of(today):
+            continue
+        # Instance du prefetch, distincte de celles de lots : pas d'effet de bord
+        lot.remaining_quantity += sale_item_lot.quantity
+        lot.stock_value = lot.sale_price * lot.remaining_quantity
+        merged[lot.pk] = lot
+    return sorted(merged.values(), key=attrgetter('expiration_date', 'created_at'))
+
+
+def _allocate_fefo(lots, quantity):
+    """
+    Répartit la quantité sur les lots (FEFO).
+    Retourne (lots_to_use, prix total, quantité non couverte).
+    Un lot pris en entier apporte sa valeur calculée par la base : seul le
+    dernier lot, entamé, est multiplié ici.
+    """
+    lots_to_use = []
+    total_price = Decimal('0.00')
+    remaining_qty = quantity
+    for lot in lots:
+        if remaining_qty <= 0:
+            break
+        if lot.remaining_quantity <= remaining_qty:
+            qty_from_lot = lot.remaining_quantity
+            total_price += lot.stock_value
+        else:
+            qty_from_lot = remaining_qty
+            total_price += lot.sale_price * qty_from_lot
+        lots_to_use.append({
+            'lot': lot,
+            'quantity': qty_from_lot,
+        })
+        remaining_qty -= qty_from_lot
+    return lots_to_use, total_price, remaining_qty
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def validate_sale_item(request):
@@ -146,28 +239,10 @@ def validate_sale_item(request):
     
     today = date.today()
     
-    # Récupérer les lots disponibles (FEFO)
-    available_lots = Lot.objects.filter(
-        product=product,
-        is_active=True,
-        expiration_date__gt=today,
-        remaining_quantity__gt=0,
-    ).order_by('expiration_date', 'created_at')
-    
-    # Calculer combien on peut prendre de chaque lot
-    lots_to_use = []
-    remaining_quantity = quantity
-    
-    for lot in available_lots:
-        if remaining_quantity <= 0:
-            break
-        
-        quantity_from_lot = min(lot.remaining_quantity, remaining_quantity)
-        lots_to_use.append({
-            'lot': lot,
-            'quantity': quantity_from_lot,
-        })
-        remaining_quantity -= quantity_from_lot
+    # Calculer combien on peut prendre de chaque lot (FEFO)
+    lots_to_use, total_price, remaining_quantity = _allocate_fefo(
+        _available_lots(product, today), quantity,
+    )
     
     if remaining_quantity > 0:
         total_available = quantity - remaining_quantity
@@ -182,12 +257,6 @@ def validate_sale_item(request):
     # Documentation: docs/AVERAGE_PRICE.md
     # Quand plusieurs lots avec des prix différents sont utilisés pour une vente,
     # on calcule un prix moyen pondéré pour afficher un prix unitaire unique.
-    total_price = Decimal('0.00')
-    for lot_info in lots_to_use:
-        lot = lot_info['lot']
-        qty = lot_info['quantity']
-        total_price += lot.sale_price * Decimal(str(qty))
-    
     average_price = total_price / Decimal(str(quantity))
     total_price = average_price * Decimal(str(quantity))
     
@@ -196,7 +265,16 @@ def validate_sale_item(request):
         'product_id': product.id,
         'product_name': product.name,
         'quantity': quantity,
-        'lots': lots_to_use,
+        'lots': [
+            {
+                'lot_id': lot_info['lot'].id,
+                'batch_number': lot_info['lot'].batch_number or '',
+                'expiration_date': lot_info['lot'].expiration_date.isoformat(),
+                'sale_price': str(lot_info['lot'].sale_price),
+                'quantity': lot_info['quantity'],
+            }
+            for lot_info in lots_to_use
+        ],
         'average_price': str(average_price),
         'total_price': str(total_price),
     })
@@ -208,30 +286,97 @@ def customer_list(request):
     """
     Liste des clients pour le select.
     Exclut les clients anonymes par défaut.
+    Pagination par curseur (paramètre cursor, renvoyé dans next_cursor) :
+    chaque page reprend après le dernier (nom, id) de la précédente, sans OFFSET.
     """
     # Exclure les clients anonymes de la liste déroulante
-    # Utiliser .only() pour ne charger que les champs nécessaires
-    customers = Customer.objects.filter(
-        is_anonymous=False
-    ).only(
+    # values() : des dictionnaires, sans instancier de modèles
+    customers = Customer.objects.named().values(
         'id', 'name', 'phone', 'email', 'credit_balance'
-    ).order_by('name')[:100]
+    ).order_by('name', 'id')
+    
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            last_name, last_id = _decode_cursor(cursor)
+        except ValueError:
+            return JsonResponse({'error': 'Curseur invalide'}, status=400)
+        customers = customers.filter(Q(name__gt=last_name) | Q(name=last_name, id__gt=last_id))
+    
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    customers = list(customers[:CUSTOMER_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(customers) > CUSTOMER_PAGE_SIZE:
+        customers = customers[:CUSTOMER_PAGE_SIZE]
+        last = customers[-1]
+        next_cursor = _encode_cursor(last['name'], last['id'])
     
-    results = []
     for customer in customers:
-        results.append({
-            'id': customer.id,
-            'name': customer.name,
-            'phone': customer.phone or '',
-            'email': customer.email or '',
-            'credit_balance': str(customer.credit_balance),
-        })
+        customer['credit_balance'] = str(customer['credit_balance'])
     
-    return JsonResponse({'customers': results})
+    return JsonResponse({'customers': customers, 'next_cursor': next_cursor})
+
+
+def _encode_cursor(name, pk):
+    return base64.urlsafe_b64encode(json.dumps([name, pk]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError('Curseur invalide') from exc
+    if not isinstance(name, str) or not isinstance(pk, int):
+        raise ValueError('Curseur invalide')
+    return name, pk
+
+
+def _etag(state):
+    """
+    ETag dérivé d'un état lu en base ; None (pas d'ETag) si l'objet n'existe pas.
+    """
+    if state is None:
+        return None
+    return hashlib.md5(repr(state).encode(), usedforsecurity=False).hexdigest()
+
+
+def _customer_credit_etag(request, customer_id):
+    # Le solde entre dans l'empreinte : une écriture qui contourne
+    # auto_now (update(), bulk_update) ne doit pas servir un 304 périmé
+    return _etag(
+        Customer.objects.filter(pk=customer_id).values_list('updated_at', 'credit_balance').first()
+    )
+
+
+def _sale_detail_etag(request, sale_id):
+    # Une requête agrégée étroite : la vente, son client et la dernière
+    # modification (et le nombre, pour les suppressions) de chaque relation
+    # lue par la vue, produits des lignes compris
+    return _etag(
+        Sale.objects.filter(pk=sale_id)
+        .annotate(
+            items_changed=Max('items__updated_at'),
+            items_count=Count('items', distinct=True),
+            products_changed=Max('items__product__updated_at'),
+            payments_changed=Max('payments__updated_at'),
+            payments_count=Count('payments', distinct=True),
+            invoices_changed=Max('invoices__updated_at'),
+            invoices_count=Count('invoices', distinct=True),
+        )
+        .values_list(
+            'updated_at', 'customer__updated_at',
+            'items_changed', 'items_count', 'products_changed',
+            'payments_changed', 'payments_count',
+            'invoices_changed', 'invoices_count',
+        )
+        .first()
+    )
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@condition(etag_func=_customer_credit_etag)
 def customer_credit_info(request, customer_id):
     """
     Récupère les informations de crédit d'un client.
@@ -249,13 +394,17 @@ def customer_credit_info(request, customer_id):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@condition(etag_func=_sale_detail_etag)
 def sale_detail(request, sale_id):
     """
     Récupère les détails d'une vente existante pour l'édition.
     """
     try:
-        sale = Sale.objects.select_related('customer', 'user').prefetch_related(
-            'items__product',
+        # Les lignes sont chargées avec leur produit (SaleItemManager) ;
+        # les factures arrivent déjà triées par date décroissante (Meta.ordering)
+        sale = Sale.objects.select_related('customer').prefetch_related(
+            'items',
             'payments',
             'invoices'
         ).get(pk=sale_id)
@@ -266,7 +415,7 @@ def sale_detail(request, sale_id):
     items = []
     for item in sale.items.all():
         items.append({
-            'product_id': item.product.id,
+            'product_id': item.product_id,
             'product_name': item.product.name,
             'product_barcode': item.product.barcode,
             'quantity': item.quantity,
@@ -297,7 +446,7 @@ def sale_detail(request, sale_id):
     
     # Récupérer les factures
     invoices = []
-    for invoice in sale.invoices.all().order_by('-invoice_date'):
+    for invoice in sale.invoices.all():
         invoices.append({
             'id': invoice.id,
             'invoice_number': invoice.invoice_number,
@@ -327,6 +476,25 @@ def sale_detail(request, sale_id):
     })
 
 
+def _to_int(value):
+    """
+    Identifiant entier envoyé par le client, None s'il n'est pas valide.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _products_by_id(items_data):
+    """
+    Produits référencés par les lignes, chargés par un seul in_bulk.
+    """
+    product_ids = {_to_int(item_data.get('product_id')) for item_data in items_data}
+    product_ids.discard(None)
+    return Product.objects.in_bulk(product_ids)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def create_sale(request):
@@ -420,6 +588,11 @@ def create_sale(request):
     if not items_data:
         errors['items'] = 'Au moins un produit est requis'
     
+    # Produits de toutes les lignes, puis leurs lots vendables : une requête chacun
+    today = date.today()
+    products_by_id = _products_by_id(items_data)
+    lots_by_product = _available_lots_by_product(list(products_by_id), today)
+    
     validated_items = []
     for item_data in items_data:
         product_id = item_data.get('product_id')
@@ -429,9 +602,8 @@ def create_sale(request):
             errors['items'] = 'product_id est requis pour chaque item'
             continue
         
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
+        product = products_by_id.get(_to_int(product_id))
+        if product is None:
             errors['items'] = f'Produit {product_id} non trouvé'
             continue
         
@@ -439,36 +611,14 @@ def create_sale(request):
             errors['items'] = 'La quantité doit être positive'
             continue
         
-        # Valider le stock disponible
-        today = date.today()
-        available_lots = Lot.objects.filter(
-            product=product,
-            is_active=True,
-            expiration_date__gt=today,
-            remaining_quantity__gt=0,
-        ).order_by('expiration_date', 'created_at')
-        
-        total_available = sum(lot.remaining_quantity for lot in available_lots)
-        if total_available < quantity:
+        # Valider le stock disponible et calculer le prix moyen pondéré (FEFO)
+        lots_to_use, total_price, missing_qty = _allocate_fefo(lots_by_product.get(product.pk, []), quantity)
+        if missing_qty > 0:
+            # Tous les lots ont été parcourus : le disponible est ce qui a été pris
+            total_available = quantity - missing_qty
             errors['items'] = f'Stock insuffisant pour {product.name}. Disponible: {total_available}, Demandé: {quantity}'
             continue
         
-        # Calculer le prix moyen pondéré
-        lots_to_use = []
-        remaining_qty = quantity
-        total_price = Decimal('0.00')
-        
-        for lot in available_lots:
-            if remaining_qty <= 0:
-                break
-            qty_from_lot = min(lot.remaining_quantity, remaining_qty)
-            lots_to_use.append({
-                'lot': lot,
-                'quantity': qty_from_lot,
-            })
-            total_price += lot.sale_price * Decimal(str(qty_from_lot))
-            remaining_qty -= qty_from_lot
-        
         average_price = total_price / Decimal(str(quantity))
         line_total = average_price * Decimal(str(quantity))
         
@@ -559,47 +709,29 @@ def create_sale(request):
                 status=Sale.Status.PENDING,
             )
             
-            # Créer les items et ajuster les stocks
-            for item_data in validated_items:
-                sale_item = SaleItem.objects.create(
-                    sale=sale,
+            # Créer les items en une fois : les lots (FEFO), leur traçabilité et
+            # les mouvements de stock sont écrits par bulk_create_for_sale
+            SaleItem.objects.bulk_create_for_sale(sale, (
+                SaleItem(
                     product=item_data['product'],
                     quantity=item_data['quantity'],
                     unit_price=item_data['unit_price'],
                     line_total=item_data['line_total'],
                 )
-                
-                # Ajuster les stocks (FEFO)
-                for lot_info in item_data['lots']:
-                    lot = lot_info['lot']
-                    qty = lot_info['quantity']
-                    lot.adjust_quantity(quantity_delta=-qty)
-                    
-                    # Créer le mouvement de stock
-                    from catalog.models import StockMovement
-                    StockMovement.objects.create(
-                        lot=lot,
-                        movement_type=StockMovement.MovementType.OUT,
-                        quantity=qty,
-                        source=f'Sale #{sale.id}',
-                        comment=f'Vente - Item #{sale_item.id}',
-                    )
+                for item_data in validated_items
+            ))
             
-            # Créer les paiements
-            total_paid = Decimal('0.00')
-            for payment_data in validated_payments:
-                Payment.objects.create(
+            # Créer les paiements en une fois (bulk_create ne passe pas par
+            # Payment.save) puis recalculer le montant payé, le solde et le statut
+            Payment.objects.bulk_create([
+                Payment(
                     sale=sale,
                     amount=payment_data['amount'],
                     payment_method=payment_data['payment_method'],
                 )
-                total_paid += payment_data['amount']
-            
-            # Mettre à jour les totaux de la vente
-            sale.amount_paid = total_paid
-            sale.balance_due = sale.total_amount - total_paid
-            sale.status = sale.compute_status()
-            sale.save(update_fields=['amount_paid', 'balance_due', 'status', 'updated_at'])
+                for payment_data in validated_payments
+            ])
+            sale.refresh_payment_summary()
             
             # Mettre à jour le crédit client si nécessaire
             if customer:
@@ -719,6 +851,13 @@ def update_sale(request, sale_id):
     if not items_data:
         errors['items'] = 'Au moins un produit est requis'
     
+    # Produits demandés, leurs lots vendables et lignes actuelles de la vente,
+    # chacun en une requête
+    today = date.today()
+    products_by_id = _products_by_id(items_data)
+    lots_by_product = _available_lots_by_product(list(products_by_id), today)
+    existing_items = {item.product_id: item for item in sale.items.prefetch_related('lot_items')}
+    
     validated_items = []
     for item_data in items_data:
         product_id = item_data.get('product_id')
@@ -728,9 +867,8 @@ def update_sale(request, sale_id):
             errors['items'] = 'product_id est requis pour chaque item'
             continue
         
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
+        product = products_by_id.get(_to_int(product_id))
+        if product is None:
             errors['items'] = f'Produit {product_id} non trouvé'
             continue
         
@@ -739,47 +877,16 @@ def update_sale(request, sale_id):
             continue
         
         # Valider le stock disponible (en tenant compte du stock déjà réservé par cette vente)
-        today = date.today()
-        available_lots = Lot.objects.filter(
-            product=product,
-            is_active=True,
-            expiration_date__gt=today,
-            remaining_quantity__gt=0,
-        ).order_by('expiration_date', 'created_at')
-        
-        # Calculer le stock disponible en tenant compte des items existants de cette vente
-        existing_item = sale.items.filter(product_id=product_id).first()
-        existing_quantity = existing_item.quantity if existing_item else 0
-        
-        total_available = sum(lot.remaining_quantity for lot in available_lots) + existing_quantity
-        if total_available < quantity:
+        # et calculer le prix moyen pondéré (FEFO), sans rien écrire
+        available_lots = _with_restored_lots(
+            lots_by_product.get(product.pk, []), existing_items.get(product.pk), today,
+        )
+        lots_to_use, total_price, missing_qty = _allocate_fefo(available_lots, quantity)
+        if missing_qty > 0:
+            total_available = quantity - missing_qty
             errors['items'] = f'Stock insuffisant pour {product.name}. Disponible: {total_available}, Demandé: {quantity}'
             continue
         
-        # Calculer le prix moyen pondéré
-        lots_to_use = []
-        remaining_qty = quantity
-        total_price = Decimal('0.00')
-        
-        # Si on augmente la quantité, on doit prendre en compte le stock déjà réservé
-        if existing_item and quantity > existing_quantity:
-            # Restaurer le stock des items existants d'abord
-            for sale_item_lot in existing_item.lot_items.all():
-                lot = sale_item_lot.lot
-                lot.adjust_quantity(quantity_delta=sale_item_lot.quantity)
-                remaining_qty -= sale_item_lot.quantity
-        
-        for lot in available_lots:
-            if remaining_qty <= 0:
-                break
-            qty_from_lot = min(lot.remaining_quantity, remaining_qty)
-            lots_to_use.append({
-                'lot': lot,
-                'quantity': qty_from_lot,
-            })
-            total_price += lot.sale_price * Decimal(str(qty_from_lot))
-            remaining_qty -= qty_from_lot
-        
         average_price = total_price / Decimal(str(quantity))
         line_total = average_price * Decimal(str(quantity))
         
@@ -826,25 +933,22 @@ def update_sale(request, sale_id):
     # Mettre à jour la vente dans une transaction
     try:
         with transaction.atomic():
-            # Restaurer les stocks des items existants
-            for existing_item in sale.items.all():
-                # Récupérer les SaleItemLot pour restaurer les stocks
-                # Le related_name est 'lot_items', pas 'lots_used'
-                for sale_item_lot in existing_item.lot_items.all():
-                    lot = sale_item_lot.lot
-                    lot.adjust_quantity(quantity_delta=sale_item_lot.quantity)
-                    
-                    # Créer le mouvement de stock
-                    from catalog.models import StockMovement
-                    StockMovement.objects.create(
-                        lot=lot,
-                        movement_type=StockMovement.MovementType.IN,
-                        quantity=sale_item_lot.quantity,
-                        source=f'Sale #{sale.id}',
-                        comment=f'Annulation vente - Item #{existing_item.id}',
-                    )
+            # Restaurer les stocks des items existants : un UPDATE pour tous les
+            # lots et un INSERT groupé pour les mouvements (StockMovement.bulk_apply)
+            StockMovement.bulk_apply(
+                StockMovement(
+                    lot=sale_item_lot.lot,
+                    movement_type=StockMovement.MovementType.IN,
+                    quantity=sale_item_lot.quantity,
+                    source=f'Sale #{sale.id}',
+                    comment=f'Annulation vente - Item #{sale_item_lot.sale_item_id}',
+                )
+                for sale_item_lot in SaleItemLot.objects.filter(sale_item__sale=sale)
+            )
             
-            # Supprimer les anciens items (les paiements seront mis à jour, pas supprimés)
+            # Supprimer les anciens items (les paiements seront mis à jour, pas supprimés) ;
+            # le delete() du queryset ne repasse pas par SaleItem.delete : pas de
+            # seconde restauration
             sale.items.all().delete()
             
             # Calculer le sous-total
@@ -892,39 +996,24 @@ def update_sale(request, sale_id):
                 sale.sale_date = parse_datetime(data.get('sale_date'))
             sale.save()
             
-            # Créer les nouveaux items et ajuster les stocks
-            for item_data in validated_items:
-                sale_item = SaleItem.objects.create(
-                    sale=sale,
+            # Créer les nouveaux items en une fois : les lots (FEFO), leur
+            # traçabilité et les mouvements de stock sont écrits par bulk_create_for_sale
+            SaleItem.objects.bulk_create_for_sale(sale, (
+                SaleItem(
                     product=item_data['product'],
                     quantity=item_data['quantity'],
                     unit_price=item_data['unit_price'],
                     line_total=item_data['line_total'],
                 )
-                
-                # Ajuster les stocks (FEFO)
-                for lot_info in item_data['lots']:
-                    lot = lot_info['lot']
-                    qty = lot_info['quantity']
-                    lot.adjust_quantity(quantity_delta=-qty)
-                    
-                    # Créer le mouvement de stock
-                    from catalog.models import StockMovement
-                    StockMovement.objects.create(
-                        lot=lot,
-                        movement_type=StockMovement.MovementType.OUT,
-                        quantity=qty,
-                        source=f'Sale #{sale.id}',
-                        comment=f'Vente - Item #{sale_item.id}',
-                    )
+                for item_data in validated_items
+            ))
             
             # Gérer les paiements en préservant l'horodatage
             # Récupérer tous les paiements existants indexés par ID
             existing_payments_dict = {p.id: p for p in sale.payments.all()}
-            payment_ids_to_keep = set()
-            total_paid = Decimal('0.00')
+            payments_to_update = []
+            payments_to_create = []
             
-            # Mettre à jour ou créer les paiements
             for payment_data in validated_payments:
                 amount = payment_data['amount']
                 payment_method = payment_data['payment_method']
@@ -932,33 +1021,28 @@ def update_sale(request, sale_id):
                 
                 if payment_id and payment_id in existing_payments_dict:
                     # Mettre à jour le paiement existant (préserve created_at et payment_date)
-                    existing_payment = existing_payments_dict[payment_id]
+                    existing_payment = existing_payments_dict.pop(payment_id)
                     existing_payment.amount = amount
                     existing_payment.payment_method = payment_method
-                    # Ne pas modifier payment_date ni created_at
-                    existing_payment.save(update_fields=['amount', 'payment_method', 'updated_at'])
-                    payment_ids_to_keep.add(payment_id)
-                    total_paid += amount
+                    # bulk_update n'applique pas auto_now
+                    existing_payment.updated_at = timezone.now()
+                    payments_to_update.append(existing_payment)
                 else:
                     # Créer un nouveau paiement
-                    new_payment = Payment.objects.create(
+                    payments_to_create.append(Payment(
                         sale=sale,
                         amount=amount,
                         payment_method=payment_method,
-                    )
-                    payment_ids_to_keep.add(new_payment.id)
-                    total_paid += amount
+                    ))
             
+            # Une écriture groupée par opération ; aucune ne passe par Payment.save
+            # ni Payment.delete : le montant payé, le solde et le statut sont
+            # recalculés une fois ensuite. payment_date et created_at ne sont pas modifiés
+            Payment.objects.bulk_update(payments_to_update, ['amount', 'payment_method', 'updated_at'])
+            Payment.objects.bulk_create(payments_to_create)
             # Supprimer les paiements qui ne sont plus dans la liste
-            for payment_id, payment in existing_payments_dict.items():
-                if payment_id not in payment_ids_to_keep:
-                    payment.delete()
-            
-            # Mettre à jour les totaux de la vente
-            sale.amount_paid = total_paid
-            sale.balance_due = sale.total_amount - total_paid
-            sale.status = sale.compute_status()
-            sale.save(update_fields=['amount_paid', 'balance_due', 'status', 'updated_at'])
+            sale.payments.filter(pk__in=list(existing_payments_dict)).delete()
+            sale.refresh_payment_summary()
             
             # Mettre à jour le crédit client si nécessaire
             if customer:
@@ -42,7 +42,8 @@ class Command(BaseCommand):
         for sale in sales:
             invoice, _ = Invoice.objects.get_or_create(
                 sale=sale,
-                defaults={'invoice_number': Invoice.generate_invoice_number()},
+                # Callable : numéro généré seulement si la facture est créée
+                defaults={'invoice_number': Invoice.generate_invoice_number},
             )
 
             if invoice.pdf and not force:
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_change_invoice_to_foreignkey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('balance_due__gt', 0)), fields=['customer'], include=['balance_due'], name='sale_credit_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_sale_credit_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('is_anonymous', False)), fields=['name'], name='cust_named_idx'),
+        ),
+    ]
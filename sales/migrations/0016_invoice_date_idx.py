@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-15 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0015_search_trgm_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-invoice_date'], name='invoice_date_idx'),
+        ),
+    ]
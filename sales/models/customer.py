@@ -4,11 +4,21 @@ Modèle pour les clients.
 
 from decimal import Decimal
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 from pharmacy_pos.common.models import TimeStampedModel
 
 
+class CustomerQuerySet(models.QuerySet):
+    def named(self):
+        """
+        Clients non anonymes, listés par défaut (index partiel cust_named_idx).
+        """
+        return self.filter(is_anonymous=False)
+
+
 class Customer(TimeStampedModel):
     name = models.CharField('Nom', max_length=255)
     phone = models.CharField('Téléphone', max_length=50, blank=True)
@@ -26,10 +36,20 @@ class Customer(TimeStampedModel):
         help_text='Les clients anonymes ne sont pas listés par défaut dans les formulaires et listes',
     )
 
+    objects = CustomerQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Client'
         verbose_name_plural = 'Clients'
         ordering = ['name']
+        indexes = [
+            # Listes triées par nom qui excluent les clients anonymes
+            models.Index(fields=['name'], name='cust_named_idx', condition=models.Q(is_anonymous=False)),
+            # Recherche admin (icontains : UPPER(col) LIKE ...)
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='cust_name_trgm_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='cust_email_trgm_idx'),
+            GinIndex(OpClass(Upper('phone'), name='gin_trgm_ops'), name='cust_phone_trgm_idx'),
+        ]
 
     @property
     def has_debt(self) -> bool:
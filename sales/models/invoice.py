@@ -2,15 +2,20 @@
 Modèle pour les factures.
 """
 
-import uuid
+import secrets
+from typing import List
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 from pharmacy_pos.common.models import TimeStampedModel
 
 from .sale import Sale
 
+_TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+
 
 class Invoice(TimeStampedModel):
     sale = models.ForeignKey(
@@ -29,6 +34,11 @@ class Invoice(TimeStampedModel):
         verbose_name = 'Facture'
         verbose_name_plural = 'Factures'
         ordering = ['-invoice_date']
+        indexes = [
+            models.Index(fields=['-invoice_date'], name='invoice_date_idx'),
+            # Recherche admin (icontains : UPPER(col) LIKE ...)
+            GinIndex(OpClass(Upper('invoice_number'), name='gin_trgm_ops'), name='invoice_number_trgm_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Facture {self.invoice_number}'
@@ -40,7 +50,15 @@ class Invoice(TimeStampedModel):
 
     @staticmethod
     def generate_invoice_number() -> str:
-        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        random_suffix = uuid.uuid4().hex[:6].upper()
-        return f'INV-{timestamp}-{random_suffix}'
+        timestamp = timezone.now().strftime(_TIMESTAMP_FORMAT)
+        return f'INV-{timestamp}-{secrets.token_hex(3).upper()}'
+
+    @staticmethod
+    def generate_invoice_numbers(count: int) -> List[str]:
+        """
+        Génère count numéros distincts pour un bulk_create : une seule date
+        et un seul suffixe aléatoire, suivis d'un compteur.
+        """
+        prefix = f'INV-{timezone.now().strftime(_TIMESTAMP_FORMAT)}-{secrets.token_hex(3).upper()}'
+        return [f'{prefix}{index:04d}' for index in range(1, count + 1)]
 
@@ -45,6 +45,10 @@ class Payment(TimeStampedModel):
         verbose_name = 'Paiement'
         verbose_name_plural = 'Paiements'
         ordering = ['-payment_date']
+        indexes = [
+            models.Index(fields=['-payment_date'], name='payment_date_idx'),
+            models.Index(fields=['payment_method', '-payment_date'], name='payment_method_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Paiement {self.amount} pour la vente #{self.sale_id}'
@@ -7,8 +7,10 @@ from decimal import Decimal
 from typing import Optional
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
-from django.db.models import Sum
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Upper
 from django.utils import timezone
 
 from pharmacy_pos.common.models import TimeStampedModel
@@ -114,10 +116,36 @@ class Sale(TimeStampedModel):
         verbose_name = 'Vente'
         verbose_name_plural = 'Ventes'
         ordering = ['-sale_date']
+        indexes = [
+            # Liste des ventes (tri par date, filtre par statut)
+            models.Index(fields=['-sale_date'], name='sale_date_idx'),
+            models.Index(fields=['status', '-sale_date'], name='sale_status_date_idx'),
+            # Recherche admin par référence (icontains : UPPER(col) LIKE ...)
+            GinIndex(OpClass(Upper('reference'), name='gin_trgm_ops'), name='sale_reference_trgm_idx'),
+            # Ventes à crédit restant dues : sert recalculate_customer_credit
+            models.Index(
+                fields=['customer'],
+                name='sale_credit_idx',
+                include=['balance_due'],
+                condition=Q(balance_due__gt=0),
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.reference or f'Vente #{self.pk or "—"}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs chargées dont dépend le crédit client : save() les compare
+        # pour savoir si un recalcul est nécessaire
+        if all(field in field_names for field in _CREDIT_FIELDS):
+            instance._loaded_credit_state = instance._credit_state()
+        return instance
+
+    def _credit_state(self) -> tuple:
+        return tuple(self.__dict__.get(field) for field in _CREDIT_FIELDS)
+
     @staticmethod
     def generate_reference() -> str:
         """
@@ -138,8 +166,10 @@ class Sale(TimeStampedModel):
         
         if self.discount_type == self.DiscountType.PERCENTAGE:
             # Calculer le montant réel pour l'affichage
-            # On utilise le subtotal actuel pour le calcul
-            subtotal = self.items.aggregate(total=Sum('line_total'))['total'] or Decimal('0.00')
+            # Total des lignes annoté par le queryset (ex. SaleAdmin), sinon agrégé ici
+            subtotal = self.__dict__.get('_items_total')
+            if subtotal is None:
+                subtotal = self.items.aggregate(total=Sum('line_total'))['total'] or Decimal('0.00')
             discount_amount = self.calculate_discount_amount(subtotal)
             return f"{self.discount_value}% ({discount_amount:.2f} GNF)"
         else:
@@ -158,10 +188,26 @@ class Sale(TimeStampedModel):
         subtotal = self.items.aggregate(total=Sum('line_total'))['total'] or Decimal('0.00')
         discount_amount = self.calculate_discount_amount(subtotal)
         self.subtotal = subtotal - discount_amount  # Sous-total après remise
+        self._save_computed_totals(_TOTALS_FIELDS)
+
+    def _save_computed_totals(self, update_fields) -> None:
+        """
+        Enregistre sans que save() ne ré-agrège les lignes : le sous-total
+        est déjà à jour. save() recalcule une seule fois total, solde et statut.
+        """
+        self._totals_updated = True
+        try:
+            self.save(update_fields=update_fields)
+        finally:
+            del self._totals_updated
+
+    def _recompute_money(self) -> None:
+        """
+        Dérive total, solde et statut du sous-total, de la taxe et du montant payé.
+        """
         self.total_amount = self.subtotal + self.tax_amount
         self.balance_due = self.total_amount - self.amount_paid
         self.status = self.compute_status()
-        self.save(update_fields=['subtotal', 'total_amount', 'balance_due', 'status', 'updated_at'])
 
     def compute_status(self) -> str:
         """
@@ -179,9 +225,7 @@ class Sale(TimeStampedModel):
     def refresh_payment_summary(self) -> None:
         payments_total = self.payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
         self.amount_paid = payments_total
-        self.balance_due = self.total_amount - payments_total
-        self.status = self.compute_status()
-        self.save(update_fields=['amount_paid', 'balance_due', 'status', 'updated_at'])
+        self._save_computed_totals(_PAYMENT_FIELDS)
 
     def update_customer_credit_balance(self) -> None:
         self.recalculate_customer_credit(self.customer_id)
@@ -194,45 +238,76 @@ class Sale(TimeStampedModel):
         """
         if not customer_id:
             return
-        customer = Customer.objects.filter(pk=customer_id).first()
-        if not customer:
-            return
-        
-        # Calculer le crédit total : montant total APRÈS remise - montant payé
-        # Le total_amount est déjà calculé comme (items_total - discount_amount) + tax_amount
-        credit_total = Decimal('0.00')
-        for sale in customer.sales.all():
-            # total_amount est déjà le montant après remise
-            amount_due = sale.total_amount - sale.amount_paid
-            if amount_due > 0:
-                credit_total += amount_due
-        
-        customer.credit_balance = credit_total
-        customer.save(update_fields=['credit_balance', 'updated_at'])
+        # Crédit total : somme des soldes positifs (balance_due vaut toujours
+        # total_amount - amount_paid, cf. save), calculée et écrite par un
+        # seul UPDATE ; l'index partiel sale_credit_idx couvre la sous-requête
+        amounts_due = (
+            Sale.objects.filter(customer=OuterRef('pk'), balance_due__gt=0)
+            .order_by()
+            .values('customer')
+            .annotate(total=Sum('balance_due'))
+            .values('total')
+        )
+        Customer.objects.filter(pk=customer_id).update(
+            credit_balance=Coalesce(
+                Subquery(amounts_due),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
+        )
 
     def save(self, *args, **kwargs) -> None:
         # Générer la référence si elle n'existe pas
         if not self.reference:
             self.reference = self.generate_reference()
         
+        loaded_state = getattr(self, '_loaded_credit_state', None)
         previous_customer_id: Optional[int] = None
-        if self.pk:
-            previous_customer_id = Sale.objects.only('customer_id').get(pk=self.pk).customer_id
+        if loaded_state is not None:
+            previous_customer_id = loaded_state[0]
+        elif self.pk:
+            previous_customer_id = Sale.objects.filter(pk=self.pk).values_list('customer_id', flat=True).first()
         self.subtotal = self.subtotal or Decimal('0.00')
         self.tax_amount = self.tax_amount or Decimal('0.00')
         self.discount_value = self.discount_value or Decimal('0.00')
         self.amount_paid = self.amount_paid or Decimal('0.00')
         # Le subtotal est déjà calculé après remise dans update_totals_from_items
-        # Sinon, on recalcule ici (seulement si la vente existe déjà en base)
-        if not hasattr(self, '_totals_updated') and self.pk:
+        # Sinon, on recalcule ici (seulement si la vente existe déjà en base
+        # et si le subtotal fait partie des champs enregistrés)
+        update_fields = kwargs.get('update_fields')
+        if (
+            not hasattr(self, '_totals_updated')
+            and self.pk
+            and (update_fields is None or 'subtotal' in update_fields)
+        ):
             items_subtotal = self.items.aggregate(total=Sum('line_total'))['total'] or Decimal('0.00')
             discount_amount = self.calculate_discount_amount(items_subtotal)
             self.subtotal = items_subtotal - discount_amount
-        self.total_amount = self.subtotal + self.tax_amount
-        self.balance_due = self.total_amount - self.amount_paid
-        self.status = self.compute_status()
+        self._recompute_money()
         super().save(*args, **kwargs)
+        credit_state = self._credit_state()
+        if update_fields is None:
+            self._loaded_credit_state = credit_state
+        elif loaded_state is not None:
+            # Seuls les champs écrits reflètent désormais la base
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            self._loaded_credit_state = tuple(
+                value if field in saved else loaded
+                for field, value, loaded in zip(_CREDIT_FIELDS, credit_state, loaded_state)
+            )
+        if credit_state == loaded_state:
+            # Ni client ni montants modifiés : crédit inchangé
+            return
         if previous_customer_id and previous_customer_id != self.customer_id:
             self.recalculate_customer_credit(previous_customer_id)
         self.update_customer_credit_balance()
 
+
+# Champs enregistrés par update_totals_from_items et refresh_payment_summary
+_TOTALS_FIELDS = ('subtotal', 'total_amount', 'balance_due', 'status', 'updated_at')
+_PAYMENT_FIELDS = ('amount_paid', 'balance_due', 'status', 'updated_at')
+
+# Champs dont dépend le solde crédit du client
+_CREDIT_FIELDS = ('customer_id', 'total_amount', 'amount_paid')
+
@@ -2,7 +2,10 @@
 Modèles pour les lignes de vente et la traçabilité par lot.
 """
 
+from datetime import date
 from decimal import Decimal
+from itertools import groupby
+from operator import attrgetter
 from typing import List, Tuple
 
 from django.core.validators import MinValueValidator
@@ -16,6 +19,51 @@ from pharmacy_pos.common.models import TimeStampedModel
 from .sale import Sale
 
 
+class SaleItemManager(models.Manager):
+    """
+    Charge le produit avec chaque ligne (son nom sert à __str__).
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('product')
+
+    def bulk_create_for_sale(self, sale: Sale, items, batch_size: int = 500) -> List['SaleItem']:
+        """
+        Insère les lignes d'une vente en une fois. bulk_create ne passe pas par
+        SaleItem.save : les lots FEFO, la traçabilité et les mouvements de stock
+        sont écrits ici en écritures groupées, puis les totaux de la vente
+        recalculés une seule fois.
+        """
+        items = list(items)
+        for item in items:
+            item.sale = sale
+            item.prepare_line_total()
+        with transaction.atomic():
+            created = self.bulk_create(items, batch_size=batch_size)
+            # Lots FEFO de tous les produits de la vente en une seule requête,
+            # verrouillés jusqu'à la fin de la transaction (voir _get_lots_for_sale)
+            lots_by_product = {
+                product_id: list(lots)
+                for product_id, lots in groupby(
+                    SaleItem.available_lots_queryset().select_for_update().filter(
+                        product_id__in={item.product_id for item in created},
+                    ).order_by('product_id', 'expiration_date', 'created_at'),
+                    key=attrgetter('product_id'),
+                )
+            }
+            sale_item_lots = []
+            movements = []
+            for item in created:
+                lots_to_use = item._get_lots_for_sale(item.quantity, lots_by_product.get(item.product_id, []))
+                item_lots, item_movements = item._build_lot_records(lots_to_use)
+                sale_item_lots.extend(item_lots)
+                movements.extend(item_movements)
+            SaleItemLot.objects.bulk_create(sale_item_lots, batch_size=batch_size)
+            StockMovement.bulk_apply(movements)
+            sale.update_totals_from_items()
+        return created
+
+
 class SaleItem(TimeStampedModel):
     sale = models.ForeignKey(
         Sale,
@@ -46,6 +94,8 @@ class SaleItem(TimeStampedModel):
         default=Decimal('0.00'),
     )
 
+    objects = SaleItemManager()
+
     class Meta:
         verbose_name = 'Ligne de vente'
         verbose_name_plural = 'Lignes de vente'
@@ -54,23 +104,33 @@ class SaleItem(TimeStampedModel):
     def __str__(self) -> str:
         return f'{self.product.name} x {self.quantity}'
 
-    def _get_lots_for_sale(self, quantity_needed: int) -> List[Tuple[Lot, int]]:
+    @staticmethod
+    def available_lots_queryset(today=None):
         """
-        Récupère les lots disponibles pour la vente selon la logique FEFO.
-        Retourne une liste de tuples (lot, quantité_prélevée).
+        Lots actifs, non expirés, avec stock disponible.
         """
-        from datetime import date
-        
-        today = date.today()
-        
-        # Récupère les lots actifs, non expirés, avec stock disponible
-        # Triés par date d'expiration croissante (FEFO)
-        available_lots = Lot.objects.filter(
-            product=self.product,
+        return Lot.objects.filter(
             is_active=True,
-            expiration_date__gt=today,
+            expiration_date__gt=today or date.today(),
             remaining_quantity__gt=0,
-        ).order_by('expiration_date', 'created_at')
+        )
+
+    def _get_lots_for_sale(self, quantity_needed: int, available_lots=None) -> List[Tuple[Lot, int]]:
+        """
+        Récupère les lots disponibles pour la vente selon la logique FEFO.
+        Retourne une liste de tuples (lot, quantité_prélevée).
+        available_lots : lots du produit déjà chargés, verrouillés et triés (FEFO)
+        par l'appelant.
+        """
+        if available_lots is None:
+            # Triés par date d'expiration croissante (FEFO)
+            # product_id : pas de chargement du produit pour filtrer
+            # FOR UPDATE : une vente concurrente sur les mêmes lots attend la fin
+            # de cette transaction puis relit les quantités restantes, au lieu
+            # de répartir sur des quantités périmées
+            available_lots = self.available_lots_queryset().select_for_update().filter(
+                product_id=self.product_id,
+            ).order_by('expiration_date', 'created_at')
         
         lots_to_use = []
         remaining_quantity = quantity_needed
@@ -96,70 +156,78 @@ class SaleItem(TimeStampedModel):
         """
         Crée les SaleItemLot et met à jour les lots.
         """
+        sale_item_lots, movements = self._build_lot_records(lots_to_use)
+        SaleItemLot.objects.bulk_create(sale_item_lots)
+        # Met à jour les quantités restantes et crée les mouvements de stock
+        StockMovement.bulk_apply(movements)
+
+    def _build_lot_records(self, lots_to_use: List[Tuple[Lot, int]]) -> Tuple[list, list]:
+        """
+        Prépare, sans les enregistrer, les SaleItemLot et les mouvements de sortie.
+        """
+        sale_item_lots = []
+        movements = []
         for lot, quantity in lots_to_use:
-            # Crée le SaleItemLot
-            SaleItemLot.objects.create(
+            sale_item_lots.append(SaleItemLot(
                 sale_item=self,
                 lot=lot,
                 quantity=quantity,
                 unit_price=lot.sale_price,
-            )
-            
-            # Met à jour la quantité restante du lot
-            lot.adjust_quantity(-quantity)
-            
-            # Crée le mouvement de stock
-            StockMovement.objects.create(
+            ))
+            movements.append(StockMovement(
                 lot=lot,
                 movement_type=StockMovement.MovementType.OUT,
                 quantity=quantity,
                 source=f'Vente #{self.sale_id}',
                 comment=f'Ligne de vente {self.pk}',
                 movement_date=self.sale.sale_date,
-            )
+            ))
+        return sale_item_lots, movements
 
     def _remove_sale_item_lots(self) -> None:
         """
         Supprime les SaleItemLot et restaure les lots.
         """
-        sale_item_lots = SaleItemLot.objects.filter(sale_item=self)
-        
-        for sale_item_lot in sale_item_lots:
-            lot = sale_item_lot.lot
-            quantity = sale_item_lot.quantity
-            
-            # Restaure la quantité du lot
-            lot.adjust_quantity(quantity)
-            
-            # Crée un mouvement de stock d'entrée
-            StockMovement.objects.create(
-                lot=lot,
+        sale_item_lots = SaleItemLot.objects.filter(sale_item=self).select_related('lot')
+
+        # Restaure la quantité des lots via des mouvements d'entrée
+        StockMovement.bulk_apply(
+            StockMovement(
+                lot=sale_item_lot.lot,
                 movement_type=StockMovement.MovementType.IN,
-                quantity=quantity,
+                quantity=sale_item_lot.quantity,
                 source=f'Vente #{self.sale_id} (annulation)',
                 comment=f'Suppression ligne de vente {self.pk}',
                 movement_date=self.sale.sale_date,
             )
-        
+            for sale_item_lot in sale_item_lots
+        )
+
         # Supprime les SaleItemLot
         sale_item_lots.delete()
 
-    @transaction.atomic
-    def save(self, *args, **kwargs) -> None:
-        is_new = self.pk is None
-        previous_quantity = 0
-        
-        # Détermine le prix unitaire si non fourni
+    def prepare_line_total(self) -> None:
+        """
+        Complète le prix unitaire s'il n'est pas fourni et calcule le total de la ligne.
+        """
         if not self.unit_price:
             # Utilise le prix du dernier lot (pour affichage)
             # Mais les SaleItemLot utiliseront le prix réel de chaque lot
             self.unit_price = self.product.sale_price
+        self.line_total = (self.unit_price or Decimal('0.00')) * self.quantity
+
+    @transaction.atomic
+    def save(self, *args, **kwargs) -> None:
+        is_new = self.pk is None
+        previous_quantity = 0
+        previous_line_total = None
         
         if not is_new:
-            previous_quantity = SaleItem.objects.only('quantity').get(pk=self.pk).quantity
+            previous_quantity, previous_line_total = SaleItem.objects.values_list(
+                'quantity', 'line_total',
+            ).get(pk=self.pk)
         
-        # Calcule le total de la ligne
-        self.line_total = (self.unit_price or Decimal('0.00')) * self.quantity
+        self.prepare_line_total()
         
         # Sauvegarde d'abord pour avoir un PK
         super().save(*args, **kwargs)
@@ -179,8 +247,9 @@ class SaleItem(TimeStampedModel):
                 lots_to_use = self._get_lots_for_sale(self.quantity)
                 self._create_sale_item_lots(lots_to_use)
         
-        # Met à jour les totaux de la vente
-        self.sale.update_totals_from_items()
+        # Met à jour les totaux de la vente, sauf si le total de la ligne n'a pas changé
+        if self.line_total != previous_line_total:
+            self.sale.update_totals_from_items()
 
     @transaction.atomic
     def delete(self, *args, **kwargs) -> None:
@@ -191,6 +260,15 @@ class SaleItem(TimeStampedModel):
         sale.update_totals_from_items()
 
 
+class SaleItemLotManager(models.Manager):
+    """
+    Charge la ligne, son produit et le lot, tous lus par __str__.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('sale_item__product', 'lot')
+
+
 class SaleItemLot(TimeStampedModel):
     """
     Traçabilité des lots utilisés dans une ligne de vente.
@@ -218,6 +296,8 @@ class SaleItemLot(TimeStampedModel):
         validators=[MinValueValidator(Decimal('0.00'))],
     )
 
+    objects = SaleItemLotManager()
+
     class Meta:
         verbose_name = 'Lot de ligne de vente'
         verbose_name_plural = 'Lots de lignes de vente'
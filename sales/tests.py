@@ -1,3 +1,158 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.models import Category, DosageForm, Lot, Product, PurchaseOrder, StockMovement, Supplier
+
+from .models import Customer, Payment, Sale, SaleItemLot
+
+
+class SaleApiTests(TestCase):
+    """
+    create_sale / update_sale : lots, stock produit, mouvements et crédit client
+    restent cohérents.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='caissier', password='secret')
+        category = Category.objects.create(name='Antalgiques', code='ANT')
+        dosage_form = DosageForm.objects.create(name='Comprimé')
+        supplier = Supplier.objects.create(name='Fournisseur test')
+        cls.purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+        cls.product = Product.objects.create(
+            name='Paracétamol 500 mg',
+            barcode='3400000000011',
+            category=category,
+            dosage_form=dosage_form,
+            supplier=supplier,
+        )
+        cls.customer = Customer.objects.create(name='Client test')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # La facture PDF n'est pas l'objet de ces tests
+        patcher = mock.patch(
+            'sales.api_views.generate_invoice_for_sale',
+            return_value=mock.Mock(id=None, invoice_number=None),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Lot qui expire le premier (FEFO), puis un second lot
+        self.first_lot = self.create_lot(quantity=5, days_to_expiry=30)
+        self.second_lot = self.create_lot(quantity=10, days_to_expiry=365)
+
+    def create_lot(self, quantity, days_to_expiry):
+        return Lot.objects.create_lot(
+            purchase_order=self.purchase_order,
+            product=self.product,
+            quantity=quantity,
+            expiration_date=date.today() + timedelta(days=days_to_expiry),
+            purchase_price=Decimal('100.00'),
+            sale_price=Decimal('150.00'),
+        )
+
+    def payload(self, quantity, payments):
+        return {
+            'customer_id': self.customer.pk,
+            'sale_date': timezone.now().isoformat(),
+            'items': [{'product_id': self.product.pk, 'quantity': quantity}],
+            'payments': payments,
+        }
+
+    def create_sale(self, quantity, amount):
+        response = self.client.post(
+            reverse('sales_api:create_sale'),
+            data=json.dumps(self.payload(quantity, [{'amount': amount, 'payment_method': 'cash'}])),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return Sale.objects.get(pk=response.json()['sale_id'])
+
+    def assertStockConsistent(self, first_remaining, second_remaining):
+        self.first_lot.refresh_from_db()
+        self.second_lot.refresh_from_db()
+        self.assertEqual(self.first_lot.remaining_quantity, first_remaining)
+        self.assertEqual(self.second_lot.remaining_quantity, second_remaining)
+
+        stock = first_remaining + second_remaining
+        self.product.refresh_from_db()
+        annotated = Product.with_stock(Product.objects.filter(pk=self.product.pk)).get()
+        self.assertEqual(self.product.stock_quantity, stock)
+        self.assertEqual(annotated._total_stock, stock)
+
+        # Les mouvements expliquent tout l'écart avec les quantités reçues
+        totals = {
+            row['movement_type']: row['total']
+            for row in StockMovement.objects.order_by().values('movement_type').annotate(total=Sum('quantity'))
+        }
+        sold = totals.get(StockMovement.MovementType.OUT, 0) - totals.get(StockMovement.MovementType.IN, 0)
+        self.assertEqual(sold, 15 - stock)
+
+    def assertCredit(self, credit_balance):
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.credit_balance, Decimal(credit_balance))
+
+    def test_create_sale(self):
+        sale = self.create_sale(quantity=7, amount='500.00')
+
+        self.assertStockConsistent(first_remaining=0, second_remaining=8)
+        self.assertEqual(StockMovement.objects.filter(movement_type=StockMovement.MovementType.OUT).count(), 2)
+        self.assertEqual(SaleItemLot.objects.filter(sale_item__sale=sale).aggregate(total=Sum('quantity'))['total'], 7)
+        self.assertEqual(sale.total_amount, Decimal('1050.00'))
+        self.assertEqual(sale.amount_paid, Decimal('500.00'))
+        self.assertEqual(sale.balance_due, Decimal('550.00'))
+        self.assertEqual(sale.status, Sale.Status.PARTIAL)
+        self.assertCredit('550.00')
+
+    def test_create_sale_with_insufficient_stock(self):
+        response = self.client.post(
+            reverse('sales_api:create_sale'),
+            data=json.dumps(self.payload(16, [{'amount': '100.00', 'payment_method': 'cash'}])),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+        self.assertStockConsistent(first_remaining=5, second_remaining=10)
+
+    def test_update_sale(self):
+        sale = self.create_sale(quantity=7, amount='500.00')
+        payment = sale.payments.get()
+
+        response = self.client.put(
+            reverse('sales_api:update_sale', args=[sale.pk]),
+            data=json.dumps(self.payload(3, [{'id': payment.pk, 'amount': '450.00', 'payment_method': 'card'}])),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        # Les 7 unités sont restituées puis 3 reprises sur le premier lot
+        self.assertStockConsistent(first_remaining=2, second_remaining=10)
+        self.assertEqual(SaleItemLot.objects.filter(sale_item__sale=sale).aggregate(total=Sum('quantity'))['total'], 3)
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, Decimal('450.00'))
+        self.assertEqual(sale.status, Sale.Status.PAID)
+        self.assertEqual(sale.payments.get().pk, payment.pk)
+        self.assertCredit('0.00')
+
+    def test_customer_credit_follows_payments(self):
+        sale = self.create_sale(quantity=7, amount='500.00')
+
+        payment = Payment.objects.create(sale=sale, amount=Decimal('300.00'))
+        self.assertCredit('250.00')
+
+        payment.delete()
+        self.assertCredit('550.00')
 
-# Create your tests here.
+        Payment.objects.create(sale=sale, amount=Decimal('550.00'))
+        self.assertCredit('0.00')
+        sale.refresh_from_db()
+        self.assertEqual(sale.status, Sale.Status.PAID)